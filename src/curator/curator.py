@@ -1,71 +1,179 @@
-import logging, re, configparser, os, pickle, time
-from typing import Any
-from json import JSONDecodeError
-
-from pyconceptlibraryclient import Client, DOMAINS  # type: ignore
+import hashlib, json, logging, re, threading, configparser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TYPE_CHECKING
 
+from curator.curator_store import CuratorStore
 from curator.workflow import Workflow
 from curator.curator_types import CuratorRepo
-from llm.llm_client import LLMClient
+from util.metrics import Metrics
+
+if TYPE_CHECKING:
+    from curator.hdr_client import HDRClient
+    from llm.llm_client import LLMClient
 
 
 class Curator:
 
-    def __init__(self) -> None:
+    def __init__(self, metrics: Metrics | None = None) -> None:
         self.__logger = logging.getLogger()
         self.__config: configparser.ConfigParser = configparser.ConfigParser()
         self.__config.read('config/config.ini')
-        self.__workflow: Workflow = Workflow()
-        self.__client: Client = Client(public=True, url=DOMAINS.HDRUK)
-        self.__additionalPhenotypesFromHDR: dict[str, list[Any]] = {}
-        path: str = 'output/additionalPhenotypesFromHDR.p'
-        if os.path.exists(path):
-            with open(path, 'rb') as file:
-                self.__additionalPhenotypesFromHDR = pickle.load(file)
-        self.__LLMClient = LLMClient(False)
+        self.__metrics: Metrics = (
+            metrics
+            if metrics is not None
+            else Metrics(
+                self.__config.getfloat('METRICS', 'PROGRESS_INTERVAL', fallback=5.0)
+            )
+        )
+        self.__storePath: str = self.__config.get(
+            'STORE', 'PATH', fallback='output/curator.db'
+        )
+        self.__workflow: Workflow = Workflow(
+            self.__config.getint('JOURNAL', 'FLUSH_INTERVAL', fallback=100),
+            self.__config.getint('JOURNAL', 'COMPACT_INTERVAL', fallback=10000),
+            self.__config.getint('CURATOR', 'TAG_PROCESSES', fallback=1),
+            self.__metrics,
+            self.__storePath,
+        )
+        self.__HDRClient: 'HDRClient | None' = None
+        self.__LLMClient: 'LLMClient | None' = None
+        self.__LLMClientLock: threading.Lock = threading.Lock()
+        # the model and decoding parameters the client answers with, so they key the cache
+        self.__LLMSettings: dict[str, Any] = {}
+        for option, parse in [
+            ('MODEL', str),
+            ('TEMPERATURE', float),
+            ('TOP_P', float),
+            ('MAX_TOKENS', int),
+            ('SEED', int),
+        ]:
+            if self.__config.has_option('LLM', option):
+                self.__LLMSettings[option.lower()] = parse(
+                    self.__config.get('LLM', option)
+                )
+        self.__LLMCacheWarned: bool = False
+
+    def __getHDRClient(self) -> 'HDRClient':
+        if self.__HDRClient is None:
+            from curator.hdr_client import HDRClient
+
+            self.__HDRClient = HDRClient(
+                self.__config.get(
+                    'HDR', 'URL', fallback='https://phenotypes.healthdatagateway.org'
+                ),
+                self.__config.getint('HDR', 'WORKERS', fallback=8),
+                self.__config.getint('HDR', 'ATTEMPTS', fallback=5),
+                self.__config.getfloat('HDR', 'BACKOFF', fallback=1.0),
+                self.__config.getfloat('HDR', 'MAX_BACKOFF', fallback=30.0),
+                self.__metrics,
+            )
+        return self.__HDRClient
+
+    def __getLLMClient(self) -> 'LLMClient':
+        # workers may all miss the cache at once, but share one client
+        with self.__LLMClientLock:
+            if self.__LLMClient is None:
+                from llm.llm_client import LLMClient
+
+                self.__LLMClient = LLMClient(False)
+            return self.__LLMClient
+
+    def __sendMessage(self, message: str) -> str:
+        cacheSize: int = self.__config.getint('LLM', 'CACHE_SIZE', fallback=10000)
+        if cacheSize > 0 and 'model' not in self.__LLMSettings:
+            # without the model, answers from one no longer in use could be served
+            if not self.__LLMCacheWarned:
+                self.__logger.warning(
+                    'no [LLM] MODEL in config, so llm responses are not cached'
+                )
+                self.__LLMCacheWarned = True
+            cacheSize = 0
+        # responses are reused for the same prompt, model and decoding parameters
+        key: str = hashlib.sha256(
+            json.dumps(
+                [' '.join(message.split()), self.__LLMSettings], sort_keys=True
+            ).encode()
+        ).hexdigest()
+        if cacheSize > 0:
+            with CuratorStore(self.__storePath) as store:
+                cached: str | None = store.getLLMResponse(key)
+            if cached is not None:
+                self.__metrics.increment('llm cache hits')
+                return cached
+            self.__metrics.increment('llm cache misses')
+        self.__metrics.increment('llm calls')
+        client: 'LLMClient' = self.__getLLMClient()
+        with self.__metrics.timer('llm'):
+            response: str = client.sendMessage(message)
+        if cacheSize > 0:
+            with CuratorStore(self.__storePath) as store:
+                store.putLLMResponse(key, response, cacheSize)
+        return response
 
     def __getPhenotype(self, repoName: str) -> str:
         return repoName.split('---')[0].replace('-', ' ')
 
+    def __phenotypeId(self, about: str) -> str | None:
+        # abouts end with the phenotype's id, e.g. 'Asthma - PH123'
+        id: str = about.rsplit(' - ', 1)[-1]
+        return id if ' - ' in about and id.startswith('PH') else None
+
+    def _phenotypeIndex(self, repos: list[CuratorRepo]) -> dict[str, CuratorRepo]:
+        phenotypeIndex: dict[str, CuratorRepo] = {}
+        for repo in repos:
+            if (id := self.__phenotypeId(repo.about)) is not None:
+                phenotypeIndex.setdefault(id, repo)
+        return phenotypeIndex
+
+    def _prefetchFromHDR(self, leadPhenotypes: list[CuratorRepo]) -> None:
+        searchNames: list[str] = list(
+            dict.fromkeys(
+                self.__getPhenotype(leadPhenotype.name)
+                for leadPhenotype in leadPhenotypes
+            )
+        )
+        with CuratorStore(self.__storePath) as store:
+            uncached: list[str] = [
+                searchName
+                for searchName in searchNames
+                if store.getHdrResults(searchName) is None
+            ]
+        if not uncached:
+            return
+        searched: dict[str, list[Any]] = self.__getHDRClient().searchAll(uncached)
+        # the new results are written together, in one transaction
+        with CuratorStore(self.__storePath, len(searched) + 1) as store:
+            for searchName, results in searched.items():
+                store.putHdrResults(searchName, results)
+
     def _additionalPhenotypesFromHDR(
         self,
         phenotypeGroup: tuple[CuratorRepo, list[CuratorRepo]],
-        repos: list[CuratorRepo],
+        phenotypeIndex: dict[str, CuratorRepo],
     ) -> list[CuratorRepo]:
         searchName: str = self.__getPhenotype(phenotypeGroup[0].name)
         self.__logger.debug('searching for: ' + searchName)
+        with CuratorStore(self.__storePath) as store:
+            cached: list[Any] | None = store.getHdrResults(searchName)
         results: list[Any] = []
-        if searchName in self.__additionalPhenotypesFromHDR:
-            results = self.__additionalPhenotypesFromHDR[searchName]
-        else:
-            while True:
-                try:
-                    results = self.__client.phenotypes.get(search=searchName)
-                    break
-                except JSONDecodeError:
-                    time.sleep(5)
-                    self.__logger.warning(
-                        'error from hdr in search for ' + searchName + ', retrying...'
-                    )
-            self.__additionalPhenotypesFromHDR[searchName] = results
-            with open('output/additionalPhenotypesFromHDR.p', 'wb') as f:
-                pickle.dump(self.__additionalPhenotypesFromHDR, f)
+        if cached is not None:
+            self.__metrics.increment('hdr cache hits')
+            results = cached
+        elif (searched := self.__getHDRClient().search(searchName)) is not None:
+            results = searched
+            with CuratorStore(self.__storePath) as store:
+                store.putHdrResults(searchName, results)
         if len(results) > 0:
-            existingIds: list[str] = [
-                curatorRepo.about.split(' - ')[1]
+            existingIds: set[str] = {
+                id
                 for curatorRepo in [phenotypeGroup[0]] + phenotypeGroup[1]
-                if '- PH' in curatorRepo.about
-            ]
+                if (id := self.__phenotypeId(curatorRepo.about)) is not None
+            }
 
             def idToPhenotype(id: str) -> CuratorRepo | None:
-                repoAsList: list[CuratorRepo] = list(
-                    filter(lambda repo: id in repo.about, repos)
-                )
-                if len(repoAsList) > 0:
-                    return repoAsList[0]
-                else:
+                if id not in phenotypeIndex:
                     self.__logger.warning('no match on phenoflow for HDR id: ' + id)
-                    return None
+                return phenotypeIndex.get(id)
 
             return [
                 repo
@@ -109,7 +217,7 @@ class Curator:
                 'Which of the following ' + prompt + ':\n' + formattedPhenotypes
             )
             self.__logger.debug(message)
-            response: str = self.__LLMClient.sendMessage(message)
+            response: str = self.__sendMessage(message)
             self.__logger.debug(response)
             try:
                 extracted: str | None = (
@@ -139,18 +247,20 @@ class Curator:
         ]
         phenotypes = list(set(phenotypes) - set(exactMatches))
 
-        synonyms: list[str] = getIncluded(
-            'are another way of writing ' + self.__getPhenotype(leadPhenotype.name)
-        )
-
-        medications: list[str] = getIncluded(
-            'are medications for ' + self.__getPhenotype(leadPhenotype.name)
-        )
-
-        subconditions: list[str] = getIncluded(
+        prompts: list[str] = [
+            'are another way of writing ' + self.__getPhenotype(leadPhenotype.name),
+            'are medications for ' + self.__getPhenotype(leadPhenotype.name),
             'are subconditions (e.g. particular types) of '
-            + self.__getPhenotype(leadPhenotype.name)
-        )
+            + self.__getPhenotype(leadPhenotype.name),
+        ]
+        workers: int = self.__config.getint('CURATOR', 'LLM_WORKERS', fallback=3)
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                synonyms, medications, subconditions = executor.map(
+                    getIncluded, prompts
+                )
+        else:
+            synonyms, medications, subconditions = map(getIncluded, prompts)
 
         return exactMatches + [
             phenotype
@@ -159,19 +269,42 @@ class Curator:
             and self.__getPhenotype(phenotype.name) not in subconditions
         ]
 
+    def _memberIndex(
+        self, phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]]
+    ) -> dict[CuratorRepo, set[CuratorRepo]]:
+        # member -> the groups it appears in
+        memberIndex: dict[CuratorRepo, set[CuratorRepo]] = {}
+        for key, phenotypes in phenotypeGroups.items():
+            for phenotype in phenotypes:
+                memberIndex.setdefault(phenotype, set()).add(key)
+        return memberIndex
+
     def _removeDuplicates(
         self,
         possibleDuplicates: list[CuratorRepo],
         phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]],
         ignore: list[CuratorRepo],
+        memberIndex: dict[CuratorRepo, set[CuratorRepo]] | None = None,
     ) -> dict[CuratorRepo, list[CuratorRepo]]:
+        if memberIndex is None:
+            memberIndex = self._memberIndex(phenotypeGroups)
+        ignored: set[CuratorRepo] = set(ignore)
+        if possibleDuplicates:
+            # groups already left empty are dropped along with any that empty now
+            for key in [
+                key
+                for key, phenotypes in phenotypeGroups.items()
+                if not phenotypes and key not in ignored
+            ]:
+                del phenotypeGroups[key]
         for possibleDuplicate in possibleDuplicates:
-            for key in list(set(phenotypeGroups.keys()) - set(ignore)):
+            for key in memberIndex.get(possibleDuplicate, set()) - ignored:
                 phenotypeGroups[key] = [
                     phenotype
                     for phenotype in phenotypeGroups[key]
                     if phenotype != possibleDuplicate
                 ]
+                memberIndex[possibleDuplicate].discard(key)
                 if not phenotypeGroups[key]:
                     del phenotypeGroups[key]
         return phenotypeGroups
@@ -181,9 +314,14 @@ class Curator:
         reposToSteps: dict[CuratorRepo, list[str]],
     ) -> dict[CuratorRepo, list[CuratorRepo]]:
         phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = (
-            self.__workflow.getPhenotypeGroups(reposToSteps)
+            self.__workflow.getPhenotypeGroups(
+                reposToSteps,
+                self.__config.getboolean(
+                    'CURATOR', 'PHENOTYPE_SIMILARITY', fallback=False
+                ),
+            )
         )
-        for phenotypeGroup in list(
+        largestGroups: list[tuple[CuratorRepo, list[CuratorRepo]]] = list(
             dict(
                 sorted(
                     phenotypeGroups.items(),
@@ -191,7 +329,15 @@ class Curator:
                     reverse=True,
                 )
             ).items()
-        )[: int(self.__config.get('CURATOR', 'MAX_LLM'))]:
+        )[: int(self.__config.get('CURATOR', 'MAX_LLM'))]
+        self._prefetchFromHDR([phenotypeGroup[0] for phenotypeGroup in largestGroups])
+        phenotypeIndex: dict[str, CuratorRepo] = self._phenotypeIndex(
+            list(reposToSteps.keys())
+        )
+        memberIndex: dict[CuratorRepo, set[CuratorRepo]] = self._memberIndex(
+            phenotypeGroups
+        )
+        for phenotypeGroup in largestGroups:
             originalPhenotypesInGroup: list[CuratorRepo] = phenotypeGroups[
                 phenotypeGroup[0]
             ]
@@ -199,11 +345,14 @@ class Curator:
                 self._removeUnrelatedPhenotypesUsingLLM(
                     phenotypeGroup[0],
                     phenotypeGroup[1]
-                    + self._additionalPhenotypesFromHDR(
-                        phenotypeGroup, list(reposToSteps.keys())
-                    ),
+                    + self._additionalPhenotypesFromHDR(phenotypeGroup, phenotypeIndex),
                 )
             )
+            # the index follows the group's new membership
+            for phenotype in originalPhenotypesInGroup:
+                memberIndex.get(phenotype, set()).discard(phenotypeGroup[0])
+            for phenotype in phenotypeGroups[phenotypeGroup[0]]:
+                memberIndex.setdefault(phenotype, set()).add(phenotypeGroup[0])
             phenotypeGroups = self._removeDuplicates(
                 list(
                     set(phenotypeGroups[phenotypeGroup[0]])
@@ -211,6 +360,7 @@ class Curator:
                 ),
                 phenotypeGroups,
                 [phenotypeGroup[0]],
+                memberIndex,
             )
 
         return phenotypeGroups
@@ -218,6 +368,14 @@ class Curator:
     def getIntersections(
         self, workflows: dict[CuratorRepo, list[str]]
     ) -> dict[CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]]:
-        return self.__workflow.getIntersections(
-            workflows, self.getPhenotypeGroups(workflows)
+        intersections: dict[
+            CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
+        ] = self.__workflow.getIntersections(
+            workflows,
+            self.getPhenotypeGroups(workflows),
+            self.__config.getint('CURATOR', 'INTERSECTION_JOBS', fallback=1),
+        )
+        self.__metrics.export(
+            self.__config.get('METRICS', 'PATH', fallback='output/metrics.json')
         )
+        return intersections
@@ -1,21 +1,66 @@
-import datetime, logging, os, pickle, time
+import logging, os, pickle, time, urllib.parse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from github import Github
+from typing import Any, Callable, Generator, TypeVar
+from urllib3.util.retry import Retry
+from github import Github, GithubException, RateLimitExceededException
+from github.GitTree import GitTree
 from github.Organization import Organization
 from github.PaginatedList import PaginatedList
 from github.Repository import Repository
-from github.RateLimit import RateLimit
 from github.ContentFile import ContentFile
 
-from curator.curator_types import CuratorRepo
+from curator.curator_store import CuratorStore
+from curator.curator_types import CuratorRepo, RepoContent, RepoState, SyncResult
+from curator.repo_tree import RepoTree
+from util.journal import Journal
+from util.metrics import Metrics, Progress
+from util.rate_limiter import RateLimiter
+
+T = TypeVar('T')
 
 
 class CuratorGithub:
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        flushInterval: int = 100,
+        compactInterval: int = 10000,
+        metrics: Metrics | None = None,
+        workers: int = 8,
+        baseUrl: str = 'https://api.github.com',
+        recursive: bool = True,
+        rateLimiter: RateLimiter | None = None,
+        storePath: str = 'output/curator.db',
+    ) -> None:
         self.__logger: logging.Logger = logging.getLogger()
-        self.__github: Github = Github(self.githubToken(), per_page=100)
-        self.__phenoflow: Organization = self.__github.get_organization('phenoflow')
+        self.__metrics: Metrics = metrics if metrics is not None else Metrics()
+        self.__flushInterval: int = flushInterval
+        self.__compactInterval: int = compactInterval
+        self.__storePath: str = storePath
+        self.__workers: int = max(workers, 1)
+        # list each repo with one recursive tree request, walking it only if truncated
+        self.__recursive: bool = recursive
+        self.__rateLimiter: RateLimiter = (
+            rateLimiter if rateLimiter is not None else RateLimiter()
+        )
+        # pacing and rate limit errors are left to the rate limiter, shared by the workers
+        self.__github: Github = Github(
+            self.githubToken(),
+            per_page=100,
+            base_url=baseUrl,
+            pool_size=self.__workers,
+            seconds_between_requests=None,
+            retry=Retry(total=10, status_forcelist=list(range(500, 600))),
+        )
+        self.__phenoflow: Organization | None = None
+
+    def __getPhenoflow(self) -> Organization:
+        if self.__phenoflow is None:
+            self.__phenoflow = self.__request(
+                lambda: self.__github.get_organization('phenoflow')
+            )
+        return self.__phenoflow
 
     def githubToken(self) -> str:
         load_dotenv()
@@ -24,13 +69,48 @@ class CuratorGithub:
             raise ValueError('GITHUB_ACCESS_TOKEN not found in .env file')
         return str(token)
 
-    def __rateCheck(self) -> float:
-        limit: RateLimit = self.__github.get_rate_limit()
-        if limit.core.remaining < 10:
-            return (
-                limit.core.reset - datetime.datetime.now(datetime.UTC)
-            ).total_seconds()
-        return 0.0
+    def __retryAfter(self, e: GithubException) -> float | None:
+        # seconds to back off for, or None if the error is not a rate limit
+        headers: dict[str, str] = {
+            key.lower(): value for key, value in (e.headers or {}).items()
+        }
+        if e.status in [403, 429] and 'retry-after' in headers:
+            return float(headers['retry-after'])
+        if not isinstance(e, RateLimitExceededException):
+            return None
+        if (
+            headers.get('x-ratelimit-remaining') == '0'
+            and 'x-ratelimit-reset' in headers
+        ):
+            return max(float(headers['x-ratelimit-reset']) - time.time(), 0.0) + 1
+        # secondary limits without a hint: github asks for at least a minute
+        return 60.0
+
+    def __request(self, request: Callable[[], T]) -> T:
+        while True:
+            if self.__rateLimiter.acquire():
+                self.__metrics.increment('rate limit waits')
+            self.__metrics.increment('github calls')
+            try:
+                with self.__metrics.timer('github'):
+                    result: T = request()
+            except GithubException as e:
+                retryAfter: float | None = self.__retryAfter(e)
+                if retryAfter is None:
+                    raise
+                self.__logger.warning(
+                    'github rate limit hit, pausing for ' + str(retryAfter) + 's'
+                )
+                self.__metrics.increment('rate limit pauses')
+                self.__rateLimiter.pause(retryAfter)
+                continue
+            # quota is read from the headers of the response just received
+            remaining, _ = self.__github.requester.rate_limiting
+            if remaining >= 0:
+                self.__rateLimiter.update(
+                    remaining, self.__github.requester.rate_limiting_resettime
+                )
+            return result
 
     def repos(self) -> list[Repository]:
         repos: list[Repository] = []
@@ -42,70 +122,333 @@ class CuratorGithub:
                 self.__logger.info('returning ' + str(len(repos)) + ' repos')
                 return repos
 
-        paginatedRepos: PaginatedList[Repository] = self.__phenoflow.get_repos()
+        paginatedRepos: PaginatedList[Repository] = self.__getPhenoflow().get_repos()
         pageNumber: int = 0
         while True:
-            time.sleep(self.__rateCheck())
-            page: list[Repository] = paginatedRepos.get_page(pageNumber)
+            page: list[Repository] = self.__request(
+                lambda: paginatedRepos.get_page(pageNumber)
+            )
             repos.extend(page)
             if len(page) < 100:
                 break
             pageNumber += 1
         with open(path, 'wb') as f:
             pickle.dump(repos, f)
+        self.__storeRepos(repos)
         self.__logger.debug(repos)
         self.__logger.info('returning ' + str(len(repos)) + ' repos')
         return repos
 
     def getRepoToSteps(self) -> dict[CuratorRepo, list[str]]:
-        repoToSteps: dict[CuratorRepo, list[str]] = {}
-        path: str = 'output/repoToSteps.p'
-        if os.path.exists(path):
-            with open(path, 'rb') as file:
-                repoToSteps = pickle.load(file)
-                self.__logger.debug(repoToSteps)
-                self.__logger.info(str(len(repoToSteps)) + ' existing repo:step pairs')
-
-        for repo in (repos := self.repos()):
-            if len(repoToSteps) == len([repo for repo in repos if '---' in repo.name]):
-                return repoToSteps
-            self.__logger.info(
-                str(round(repos.index(repo) / len(repos) * 100, 2)) + '%'
-            )
-            if '---' not in repo.name or repo.name in [
-                storedRepo.name for storedRepo in list(repoToSteps.keys())
-            ]:
-                continue
-            try:
-                steps: list[str] = []
-                contents: list[ContentFile] | ContentFile = repo.get_contents(
-                    ''
-                )  # ~MDC irritating return type...
-                if type(contents) is list:
-                    while contents:
-                        time.sleep(self.__rateCheck())
-                        content = contents.pop(0)
-                        if content.type == 'dir':
-                            newContents: list[ContentFile] | ContentFile = (
-                                repo.get_contents(content.path)
-                            )
-                            if type(newContents) is list:
-                                contents.extend(newContents)
-                        else:
-                            if '---' in content.name:
-                                steps.append(content.name)
-                    repoToSteps[
-                        CuratorRepo(
-                            repo.name, repo.description if repo.description else ''
-                        )
-                    ] = steps
-
-                    with open(path, 'wb') as f:
-                        pickle.dump(repoToSteps, f)
-            except Exception as e:
-                self.__logger.error(
-                    f'error processing repository {repo.name}: {str(e)}'
-                )
+        repoToSteps: dict[CuratorRepo, list[str]] = dict(self.iterRepoSteps())
         self.__logger.debug(repoToSteps)
         self.__logger.info('returning ' + str(len(repoToSteps)) + ' repo:step pairs')
         return repoToSteps
+
+    def iterRepoSteps(self) -> Generator[tuple[CuratorRepo, list[str]], None, None]:
+        journal: Journal[CuratorRepo, list[str]] = Journal(
+            'output/repoToSteps.p', self.__flushInterval, self.__compactInterval
+        )
+        # the journal and the store persist in batches of flushInterval as the repos
+        # stream past
+        with journal, self.__store() as store:
+            stored: dict[CuratorRepo, list[str]] = dict(journal.load())
+            if len(stored):
+                self.__logger.info(str(len(stored)) + ' existing repo:step pairs')
+            seen: set[str] = set()
+            for curatorRepo, steps in stored.items():
+                seen.add(curatorRepo.name)
+                yield curatorRepo, steps
+            pending: list[Repository] = []
+            for repo in self.repos():
+                if '---' in repo.name and repo.name not in seen:
+                    seen.add(repo.name)
+                    pending.append(repo)
+            # repos arrive in the order they were listed, so the journal keeps that order
+            for repo, crawledSteps in self.__crawlSteps(pending, {}):
+                curatorRepo = self.__curatorRepo(repo)
+                journal.put(curatorRepo, crawledSteps or [])
+                store.putRepoSteps(curatorRepo, crawledSteps or [])
+                yield curatorRepo, crawledSteps or []
+
+    def __pushedAt(self, repo: Repository) -> str:
+        return repo.pushed_at.isoformat() if repo.pushed_at else ''
+
+    def __syncRepos(self) -> list[Repository]:
+        # each page of the listing is only downloaded again if its etag has changed
+        pages: Journal[int, tuple[str | None, list[dict[str, Any]]]] = Journal(
+            'output/repoPages.p', self.__flushInterval, self.__compactInterval
+        )
+        repos: list[Repository] = []
+        with pages:
+            cachedPages: dict[int, tuple[str | None, list[dict[str, Any]]]] = dict(
+                pages.load()
+            )
+            pageNumber: int = 1
+            while True:
+                etag, page = cachedPages.get(pageNumber, (None, []))
+                headers, data = self.__request(
+                    lambda: self.__github.requester.requestJsonAndCheck(
+                        'GET',
+                        '/orgs/phenoflow/repos',
+                        parameters={'per_page': 100, 'page': pageNumber},
+                        headers={'If-None-Match': etag} if etag else None,
+                    )
+                )
+                if data is None:
+                    self.__metrics.increment('pages unchanged')
+                else:
+                    page = data
+                    pages.put(pageNumber, (headers.get('etag'), page))
+                repos.extend(
+                    self.__github.create_from_raw_data(Repository, raw) for raw in page
+                )
+                if len(page) < 100:
+                    break
+                pageNumber += 1
+            for stalePage in [page for page in cachedPages if page > pageNumber]:
+                pages.remove(stalePage)
+        with open('output/repos.p', 'wb') as f:
+            pickle.dump(repos, f)
+        self.__storeRepos(repos)
+        return repos
+
+    def __storeRepos(self, repos: list[Repository]) -> None:
+        with self.__store() as store:
+            for repo in repos:
+                store.putRepo(self.__curatorRepo(repo))
+
+    def __store(self) -> CuratorStore:
+        return CuratorStore(self.__storePath, self.__flushInterval)
+
+    def sync(self) -> SyncResult:
+        repos: list[Repository] = self.__syncRepos()
+        states: Journal[str, RepoState] = Journal(
+            'output/repoStates.p', self.__flushInterval, self.__compactInterval
+        )
+        journal: Journal[CuratorRepo, list[str]] = Journal(
+            'output/repoToSteps.p', self.__flushInterval, self.__compactInterval
+        )
+        with states, journal, self.__store() as curatorStore:
+            repoStates: dict[str, RepoState] = dict(states.load())
+            repoToSteps: dict[CuratorRepo, list[str]] = dict(journal.load())
+            stored: dict[str, CuratorRepo] = {
+                curatorRepo.name: curatorRepo for curatorRepo in repoToSteps
+            }
+            listed: dict[str, Repository] = {}
+            for repo in repos:
+                if '---' in repo.name:
+                    listed.setdefault(repo.name, repo)
+            changed: list[CuratorRepo] = []
+
+            def store(
+                repo: Repository, curatorRepo: CuratorRepo, steps: list[str]
+            ) -> None:
+                previous: CuratorRepo | None = stored.get(repo.name)
+                if previous is not None:
+                    if previous == curatorRepo and repoToSteps[previous] == steps:
+                        return
+                    journal.remove(previous)
+                    if previous != curatorRepo:
+                        curatorStore.removeRepoSteps(previous)
+                    del repoToSteps[previous]
+                stored[repo.name] = curatorRepo
+                repoToSteps[curatorRepo] = steps
+                journal.put(curatorRepo, steps)
+                curatorStore.putRepoSteps(curatorRepo, steps)
+                changed.append(curatorRepo)
+
+            removed: list[CuratorRepo] = [
+                curatorRepo
+                for name, curatorRepo in stored.items()
+                if name not in listed
+            ]
+            for curatorRepo in removed:
+                journal.remove(curatorRepo)
+                curatorStore.removeRepoSteps(curatorRepo)
+                states.remove(curatorRepo.name)
+                del repoToSteps[curatorRepo]
+                del stored[curatorRepo.name]
+            pending: list[Repository] = []
+            for name, repo in listed.items():
+                if (
+                    name in stored
+                    and name in repoStates
+                    and repoStates[name].pushedAt == self.__pushedAt(repo)
+                ):
+                    # nothing pushed, though the description may have been edited
+                    store(repo, self.__curatorRepo(repo), repoToSteps[stored[name]])
+                else:
+                    pending.append(repo)
+            etags: dict[str, str] = {
+                name: state.etag
+                for name, state in repoStates.items()
+                if state.etag and name in stored
+            }
+            for repo, steps in self.__crawlSteps(pending, etags):
+                store(
+                    repo,
+                    self.__curatorRepo(repo),
+                    steps if steps is not None else repoToSteps[stored[repo.name]],
+                )
+                states.put(
+                    repo.name, RepoState(self.__pushedAt(repo), etags.get(repo.name))
+                )
+        positions: dict[str, int] = {
+            name: position for position, name in enumerate(listed)
+        }
+        changed.sort(key=lambda curatorRepo: positions[curatorRepo.name])
+        self.__metrics.increment('repos changed', len(changed))
+        self.__logger.info(
+            str(len(changed))
+            + ' changed and '
+            + str(len(removed))
+            + ' removed repo:step pairs'
+        )
+        return SyncResult(
+            {
+                stored[name]: repoToSteps[stored[name]]
+                for name in listed
+                if name in stored
+            },
+            changed,
+            removed,
+        )
+
+    def __listing(self, repo: Repository, path: str) -> list[RepoContent] | None:
+        contents: list[ContentFile] | ContentFile = self.__request(
+            lambda: repo.get_contents(path)
+        )  # ~MDC irritating return type...
+        if type(contents) is not list:
+            return None
+        return [
+            RepoContent(content.path, content.name, content.type == 'dir')
+            for content in contents
+        ]
+
+    def __tree(
+        self, repo: Repository, etags: dict[str, str]
+    ) -> tuple[bool, RepoTree | None]:
+        # whether the tree changed since the etag held for the repo, and its listings if
+        # they could be read in one request
+        try:
+            headers, data = self.__request(
+                lambda: self.__github.requester.requestJsonAndCheck(
+                    'GET',
+                    repo.url + '/git/trees/' + urllib.parse.quote(repo.default_branch),
+                    parameters={'recursive': 1},
+                    headers=(
+                        {'If-None-Match': etags[repo.name]}
+                        if repo.name in etags
+                        else None
+                    ),
+                )
+            )
+        except GithubException as e:
+            self.__logger.warning(
+                f'no tree for repository {repo.name}, walking it instead: {str(e)}'
+            )
+            return True, None
+        if data is None:
+            self.__metrics.increment('trees unchanged')
+            return False, None
+        if headers.get('etag'):
+            etags[repo.name] = headers['etag']
+        tree: GitTree = self.__github.create_from_raw_data(GitTree, data)
+        if tree.truncated:
+            self.__metrics.increment('truncated trees')
+            return True, None
+        repoTree: RepoTree = RepoTree()
+        for element in tree.tree:
+            repoTree.add(element.path, element.type == 'tree')
+        return True, repoTree
+
+    def __crawlSteps(
+        self, pending: list[Repository], etags: dict[str, str]
+    ) -> Generator[tuple[Repository, list[str] | None], None, None]:
+        # yields repos in the order given, each as soon as it and those before it have
+        # finished, with None if its tree is unchanged; failed repos are skipped
+        if not pending:
+            return
+        progress: Progress = self.__metrics.progress('crawling', len(pending))
+        listings: dict[int, RepoTree] = {
+            position: RepoTree() for position in range(len(pending))
+        }
+        outstanding: dict[int, int] = {position: 1 for position in range(len(pending))}
+        failed: set[int] = set()
+        finished: dict[int, list[str] | None] = {}
+        released: int = 0
+        crawled: int = 0
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(self.__workers)
+        # a consumer that stops early should not wait on requests it will never see
+        try:
+            # a path of None marks a whole-tree request, anything else a directory listing
+            futures: dict[Future[Any], tuple[int, str | None]] = {
+                (
+                    executor.submit(self.__tree, repo, etags)
+                    if self.__recursive
+                    else executor.submit(self.__listing, repo, '')
+                ): (position, None if self.__recursive else '')
+                for position, repo in enumerate(pending)
+            }
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, path = futures.pop(future)
+                    outstanding[position] -= 1
+                    if position in failed:
+                        continue
+                    try:
+                        result: Any = future.result()
+                    except Exception as e:
+                        self.__logger.error(
+                            f'error processing repository {pending[position].name}: {str(e)}'
+                        )
+                        failed.add(position)
+                        listings.pop(position, None)
+                        continue
+                    if path is None:
+                        modified, tree = result
+                        if not modified:
+                            listings.pop(position)
+                            finished[position] = None
+                            crawled += 1
+                            progress.update(crawled)
+                            continue
+                        if tree is not None:
+                            listings[position] = tree
+                        else:
+                            # fall back to walking the repo one directory at a time
+                            futures[
+                                executor.submit(self.__listing, pending[position], '')
+                            ] = (position, '')
+                            outstanding[position] += 1
+                    elif result is not None:
+                        listings[position].setListing(path, result)
+                        for content in result:
+                            if content.directory:
+                                futures[
+                                    executor.submit(
+                                        self.__listing, pending[position], content.path
+                                    )
+                                ] = (position, content.path)
+                                outstanding[position] += 1
+                    elif path == '':
+                        # a repo whose root is not a directory has no steps to record
+                        failed.add(position)
+                        listings.pop(position, None)
+                        continue
+                    if outstanding[position] == 0:
+                        finished[position] = listings.pop(position).steps()
+                        self.__metrics.increment('repos crawled')
+                        crawled += 1
+                        progress.update(crawled)
+                while released in finished or released in failed:
+                    if released in finished:
+                        yield pending[released], finished.pop(released)
+                    released += 1
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def __curatorRepo(self, repo: Repository) -> CuratorRepo:
+        return CuratorRepo(repo.name, repo.description if repo.description else '')
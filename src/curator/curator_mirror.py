@@ -0,0 +1,124 @@
+import logging, os, pickle, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from curator.curator_types import CuratorRepo
+from curator.repo_tree import RepoTree
+from util.metrics import Metrics, Progress
+
+
+class CloneReader:
+
+    def read(self, path: str) -> RepoTree | None:
+        # ls-tree reads the object database directly, so bare and shallow clones work too
+        try:
+            output: bytes = subprocess.run(
+                ['git', '-C', path, 'ls-tree', '-r', '-t', '-z', 'HEAD'],
+                capture_output=True,
+                check=True,
+            ).stdout
+        except subprocess.CalledProcessError:
+            return None
+        repoTree: RepoTree = RepoTree()
+        for entry in output.decode().split('\0'):
+            if entry:
+                info, _, entryPath = entry.partition('\t')
+                repoTree.add(entryPath, info.split(' ')[1] == 'tree')
+        return repoTree
+
+
+class CuratorMirror:
+
+    def __init__(
+        self,
+        directory: str,
+        processes: int = 1,
+        metrics: Metrics | None = None,
+        reposPath: str = 'output/repos.p',
+    ) -> None:
+        self.__logger = logging.getLogger()
+        self.__directory: str = directory
+        self.__reposPath: str = reposPath
+        self.__processes: int = processes
+        self.__metrics: Metrics = metrics if metrics is not None else Metrics()
+
+    def clones(self) -> dict[str, str]:
+        # repo name -> path of its clone, bare clones being named <repo>.git
+        clones: dict[str, str] = {}
+        for entry in sorted(os.listdir(self.__directory)):
+            path: str = os.path.join(self.__directory, entry)
+            if os.path.isfile(os.path.join(path, 'HEAD')) or os.path.exists(
+                os.path.join(path, '.git')
+            ):
+                clones[entry.removesuffix('.git')] = path
+        return clones
+
+    def __descriptions(self) -> dict[str, str]:
+        # clones carry no github description, so it comes from the listed repos
+        if not os.path.exists(self.__reposPath):
+            self.__logger.warning(
+                'no repos at ' + self.__reposPath + ', so descriptions are empty'
+            )
+            return {}
+        with open(self.__reposPath, 'rb') as file:
+            return {
+                repo.name: repo.description if repo.description else ''
+                for repo in pickle.load(file)
+            }
+
+    def getRepoToSteps(self) -> dict[CuratorRepo, list[str]]:
+        descriptions: dict[str, str] = self.__descriptions()
+        # listed repos keep the listing's order, as with the github crawl, so group
+        # leads do not depend on which one read them; the rest follow by name
+        found: dict[str, str] = self.clones()
+        clones: dict[str, str] = {
+            name: found[name]
+            for name in [*descriptions, *found]
+            if name in found and '---' in name
+        }
+        reader: CloneReader = CloneReader()
+        progress: Progress = self.__metrics.progress('reading clones', len(clones))
+        repoToSteps: dict[CuratorRepo, list[str]] = {}
+        with self.__metrics.timer('mirror'):
+            if self.__processes > 1:
+                with ProcessPoolExecutor(self.__processes) as executor:
+                    self.__record(
+                        clones,
+                        executor.map(
+                            reader.read,
+                            clones.values(),
+                            chunksize=max(len(clones) // (self.__processes * 4), 1),
+                        ),
+                        descriptions,
+                        repoToSteps,
+                        progress,
+                    )
+            else:
+                self.__record(
+                    clones,
+                    map(reader.read, clones.values()),
+                    descriptions,
+                    repoToSteps,
+                    progress,
+                )
+        self.__logger.info('returning ' + str(len(repoToSteps)) + ' repo:step pairs')
+        return repoToSteps
+
+    def __record(
+        self,
+        clones: dict[str, str],
+        repoTrees: Iterable[RepoTree | None],
+        descriptions: dict[str, str],
+        repoToSteps: dict[CuratorRepo, list[str]],
+        progress: Progress,
+    ) -> None:
+        for position, (name, repoTree) in enumerate(zip(clones, repoTrees)):
+            if repoTree is None:
+                # an empty repo has nothing to read, as with the github crawl
+                self.__logger.error(f'error processing repository {name}: no tree')
+            else:
+                repoToSteps[CuratorRepo(name, descriptions.get(name, ''))] = (
+                    repoTree.steps()
+                )
+                self.__metrics.increment('clones read')
+            progress.update(position + 1)
@@ -0,0 +1,438 @@
+import json, os, pickle, sqlite3
+from types import TracebackType
+from typing import Any
+
+from curator.curator_types import CuratorRepo
+from util.journal import Journal
+
+SCHEMA: str = '''
+    CREATE TABLE IF NOT EXISTS repos (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        about TEXT NOT NULL,
+        UNIQUE (name, about)
+    );
+    CREATE TABLE IF NOT EXISTS workflows (
+        repo INTEGER PRIMARY KEY REFERENCES repos (id),
+        position INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS steps (
+        repo INTEGER NOT NULL REFERENCES workflows (repo),
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (repo, position)
+    );
+    CREATE INDEX IF NOT EXISTS stepsByName ON steps (name);
+    CREATE TABLE IF NOT EXISTS groupings (similarity INTEGER PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS groups (
+        similarity INTEGER NOT NULL,
+        lead INTEGER NOT NULL REFERENCES repos (id),
+        position INTEGER NOT NULL,
+        PRIMARY KEY (similarity, lead)
+    );
+    CREATE TABLE IF NOT EXISTS members (
+        similarity INTEGER NOT NULL,
+        lead INTEGER NOT NULL REFERENCES repos (id),
+        position INTEGER NOT NULL,
+        member INTEGER NOT NULL REFERENCES repos (id),
+        PRIMARY KEY (similarity, lead, position)
+    );
+    CREATE INDEX IF NOT EXISTS membersByMember ON members (similarity, member);
+    CREATE TABLE IF NOT EXISTS hdr (search TEXT PRIMARY KEY, results TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS intersected (
+        phenotype INTEGER PRIMARY KEY REFERENCES repos (id),
+        position INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS intersections (
+        id INTEGER PRIMARY KEY,
+        phenotype INTEGER NOT NULL REFERENCES intersected (phenotype),
+        workflowA INTEGER NOT NULL REFERENCES repos (id),
+        workflowB INTEGER NOT NULL REFERENCES repos (id),
+        stepA TEXT NOT NULL,
+        stepB TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS intersectionsByPhenotype ON intersections (phenotype);
+    CREATE TABLE IF NOT EXISTS llmResponses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        used INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS llmResponsesByUse ON llmResponses (used);
+'''
+
+
+class CuratorStore:
+
+    def __init__(
+        self, path: str = 'output/curator.db', flushInterval: int = 100
+    ) -> None:
+        self.__directory: str = os.path.dirname(path)
+        if self.__directory:
+            os.makedirs(self.__directory, exist_ok=True)
+        created: bool = not os.path.exists(path)
+        self.__connection: sqlite3.Connection = sqlite3.connect(path)
+        self.__connection.execute('PRAGMA journal_mode = WAL')
+        self.__connection.execute('PRAGMA synchronous = NORMAL')
+        self.__connection.executescript(SCHEMA)
+        self.__flushInterval: int = flushInterval
+        self.__pending: int = 0
+        self.__repoIds: dict[CuratorRepo, int] = {}
+        # a new store starts from whatever earlier runs pickled alongside it
+        if created:
+            self.importPickles(self.__directory)
+
+    def __enter__(self) -> 'CuratorStore':
+        return self
+
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __repoId(self, repo: CuratorRepo) -> int:
+        if repo not in self.__repoIds:
+            self.__connection.execute(
+                'INSERT OR IGNORE INTO repos (name, about) VALUES (?, ?)',
+                (repo.name, repo.about),
+            )
+            self.__repoIds[repo] = self.__connection.execute(
+                'SELECT id FROM repos WHERE name = ? AND about = ?',
+                (repo.name, repo.about),
+            ).fetchone()[0]
+        return self.__repoIds[repo]
+
+    def __written(self) -> None:
+        # writes are committed in batches, each put landing whole or not at all
+        self.__pending += 1
+        if self.__pending >= self.__flushInterval:
+            self.commit()
+
+    def commit(self) -> None:
+        self.__connection.commit()
+        self.__pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.__connection.close()
+
+    def putRepo(self, repo: CuratorRepo) -> None:
+        self.__repoId(repo)
+        self.__written()
+
+    def putRepoSteps(self, repo: CuratorRepo, steps: list[str]) -> None:
+        repoId: int = self.__repoId(repo)
+        self.__connection.execute(
+            'INSERT OR IGNORE INTO workflows (repo, position) '
+            'SELECT ?, COALESCE(MAX(position) + 1, 0) FROM workflows',
+            (repoId,),
+        )
+        self.__connection.execute('DELETE FROM steps WHERE repo = ?', (repoId,))
+        self.__connection.executemany(
+            'INSERT INTO steps (repo, position, name) VALUES (?, ?, ?)',
+            [(repoId, position, step) for position, step in enumerate(steps)],
+        )
+        self.__written()
+
+    def removeRepoSteps(self, repo: CuratorRepo) -> None:
+        repoId: int = self.__repoId(repo)
+        self.__connection.execute('DELETE FROM steps WHERE repo = ?', (repoId,))
+        self.__connection.execute('DELETE FROM workflows WHERE repo = ?', (repoId,))
+        self.__written()
+
+    def getRepoToSteps(self) -> dict[CuratorRepo, list[str]]:
+        repoToSteps: dict[CuratorRepo, list[str]] = {}
+        for name, about, step in self.__connection.execute(
+            'SELECT repos.name, repos.about, steps.name FROM workflows '
+            'JOIN repos ON repos.id = workflows.repo '
+            'LEFT JOIN steps ON steps.repo = workflows.repo '
+            'ORDER BY workflows.position, steps.position'
+        ):
+            steps: list[str] = repoToSteps.setdefault(CuratorRepo(name, about), [])
+            if step is not None:
+                steps.append(step)
+        return repoToSteps
+
+    def getSteps(self, repo: CuratorRepo) -> list[str] | None:
+        if (
+            self.__connection.execute(
+                'SELECT 1 FROM workflows JOIN repos ON repos.id = workflows.repo '
+                'WHERE repos.name = ? AND repos.about = ?',
+                (repo.name, repo.about),
+            ).fetchone()
+            is None
+        ):
+            return None
+        return [
+            step
+            for (step,) in self.__connection.execute(
+                'SELECT steps.name FROM steps JOIN repos ON repos.id = steps.repo '
+                'WHERE repos.name = ? AND repos.about = ? ORDER BY steps.position',
+                (repo.name, repo.about),
+            )
+        ]
+
+    def getReposWithStep(self, step: str) -> list[CuratorRepo]:
+        return [
+            CuratorRepo(name, about)
+            for name, about in self.__connection.execute(
+                'SELECT DISTINCT repos.name, repos.about FROM steps '
+                'JOIN repos ON repos.id = steps.repo WHERE steps.name = ?',
+                (step,),
+            )
+        ]
+
+    def putPhenotypeGroups(
+        self, phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]], similarity: bool
+    ) -> None:
+        self.__connection.execute(
+            'DELETE FROM members WHERE similarity = ?', (similarity,)
+        )
+        self.__connection.execute(
+            'DELETE FROM groups WHERE similarity = ?', (similarity,)
+        )
+        self.__connection.execute(
+            'INSERT OR IGNORE INTO groupings (similarity) VALUES (?)', (similarity,)
+        )
+        for position, (lead, members) in enumerate(phenotypeGroups.items()):
+            leadId: int = self.__repoId(lead)
+            self.__connection.execute(
+                'INSERT INTO groups (similarity, lead, position) VALUES (?, ?, ?)',
+                (similarity, leadId, position),
+            )
+            self.__connection.executemany(
+                'INSERT INTO members (similarity, lead, position, member) '
+                'VALUES (?, ?, ?, ?)',
+                [
+                    (similarity, leadId, memberPosition, self.__repoId(member))
+                    for memberPosition, member in enumerate(members)
+                ],
+            )
+        self.__written()
+
+    def getPhenotypeGroups(
+        self, similarity: bool
+    ) -> dict[CuratorRepo, list[CuratorRepo]] | None:
+        if (
+            self.__connection.execute(
+                'SELECT 1 FROM groupings WHERE similarity = ?', (similarity,)
+            ).fetchone()
+            is None
+        ):
+            return None
+        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {}
+        for leadName, leadAbout, memberName, memberAbout in self.__connection.execute(
+            'SELECT lead.name, lead.about, member.name, member.about FROM groups '
+            'JOIN repos AS lead ON lead.id = groups.lead '
+            'LEFT JOIN members ON members.similarity = groups.similarity '
+            'AND members.lead = groups.lead '
+            'LEFT JOIN repos AS member ON member.id = members.member '
+            'WHERE groups.similarity = ? ORDER BY groups.position, members.position',
+            (similarity,),
+        ):
+            members: list[CuratorRepo] = phenotypeGroups.setdefault(
+                CuratorRepo(leadName, leadAbout), []
+            )
+            if memberName is not None:
+                members.append(CuratorRepo(memberName, memberAbout))
+        return phenotypeGroups
+
+    def getGroupsWithMember(
+        self, member: CuratorRepo, similarity: bool
+    ) -> list[CuratorRepo]:
+        return [
+            CuratorRepo(name, about)
+            for name, about in self.__connection.execute(
+                'SELECT DISTINCT lead.name, lead.about FROM members '
+                'JOIN repos AS member ON member.id = members.member '
+                'JOIN repos AS lead ON lead.id = members.lead '
+                'WHERE members.similarity = ? AND member.name = ? AND member.about = ?',
+                (similarity, member.name, member.about),
+            )
+        ]
+
+    def putHdrResults(self, search: str, results: list[Any]) -> None:
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO hdr (search, results) VALUES (?, ?)',
+            (search, json.dumps(results)),
+        )
+        self.__written()
+
+    def getHdrResults(self, search: str) -> list[Any] | None:
+        row: tuple[str] | None = self.__connection.execute(
+            'SELECT results FROM hdr WHERE search = ?', (search,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def putIntersection(
+        self,
+        phenotype: CuratorRepo,
+        intersection: dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]],
+    ) -> None:
+        phenotypeId: int = self.__repoId(phenotype)
+        self.__connection.execute(
+            'INSERT OR IGNORE INTO intersected (phenotype, position) '
+            'SELECT ?, COALESCE(MAX(position) + 1, 0) FROM intersected',
+            (phenotypeId,),
+        )
+        self.__connection.execute(
+            'DELETE FROM intersections WHERE phenotype = ?', (phenotypeId,)
+        )
+        self.__connection.executemany(
+            'INSERT INTO intersections (phenotype, workflowA, workflowB, stepA, stepB) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [
+                (
+                    phenotypeId,
+                    self.__repoId(workflowA),
+                    self.__repoId(workflowB),
+                    stepA,
+                    stepB,
+                )
+                for (workflowA, workflowB), stepPairs in intersection.items()
+                for stepA, stepB in stepPairs
+            ],
+        )
+        self.__written()
+
+    def getIntersected(self) -> list[CuratorRepo]:
+        return [
+            CuratorRepo(name, about)
+            for name, about in self.__connection.execute(
+                'SELECT repos.name, repos.about FROM intersected '
+                'JOIN repos ON repos.id = intersected.phenotype '
+                'ORDER BY intersected.position'
+            )
+        ]
+
+    def getIntersection(
+        self, phenotype: CuratorRepo
+    ) -> dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]] | None:
+        row: tuple[int] | None = self.__connection.execute(
+            'SELECT intersected.phenotype FROM intersected '
+            'JOIN repos ON repos.id = intersected.phenotype '
+            'WHERE repos.name = ? AND repos.about = ?',
+            (phenotype.name, phenotype.about),
+        ).fetchone()
+        if row is None:
+            return None
+        intersection: dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]] = {}
+        for nameA, aboutA, nameB, aboutB, stepA, stepB in self.__connection.execute(
+            'SELECT a.name, a.about, b.name, b.about, stepA, stepB FROM intersections '
+            'JOIN repos AS a ON a.id = intersections.workflowA '
+            'JOIN repos AS b ON b.id = intersections.workflowB '
+            'WHERE intersections.phenotype = ? ORDER BY intersections.id',
+            row,
+        ):
+            intersection.setdefault(
+                (CuratorRepo(nameA, aboutA), CuratorRepo(nameB, aboutB)), set()
+            ).add((stepA, stepB))
+        return intersection
+
+    def getLLMResponse(self, key: str) -> str | None:
+        row: tuple[str] | None = self.__connection.execute(
+            'SELECT response FROM llmResponses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        # a hit makes the response the most recently used
+        self.__connection.execute(
+            'UPDATE llmResponses SET used = '
+            '(SELECT MAX(used) + 1 FROM llmResponses) WHERE key = ?',
+            (key,),
+        )
+        self.__written()
+        return row[0]
+
+    def putLLMResponse(self, key: str, response: str, maxResponses: int) -> None:
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO llmResponses (key, response, used) '
+            'SELECT ?, ?, COALESCE(MAX(used) + 1, 0) FROM llmResponses',
+            (key, response),
+        )
+        self.__connection.execute(
+            'DELETE FROM llmResponses WHERE key IN (SELECT key FROM llmResponses '
+            'ORDER BY used DESC LIMIT -1 OFFSET ?)',
+            (maxResponses,),
+        )
+        self.__written()
+
+    def importPickles(self, directory: str = 'output') -> None:
+        path: str = os.path.join(directory, 'repos.p')
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                for repo in pickle.load(file):
+                    self.putRepo(
+                        CuratorRepo(
+                            repo.name, repo.description if repo.description else ''
+                        )
+                    )
+        repoToSteps: Journal[CuratorRepo, list[str]] = Journal(
+            os.path.join(directory, 'repoToSteps.p')
+        )
+        for repo, steps in repoToSteps.load().items():
+            self.putRepoSteps(repo, steps)
+        for similarity in [False, True]:
+            path = os.path.join(
+                directory,
+                'similarPhenotypeGroups.p' if similarity else 'phenotypeGroups.p',
+            )
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    self.putPhenotypeGroups(pickle.load(file), similarity)
+        path = os.path.join(directory, 'additionalPhenotypesFromHDR.p')
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                for search, results in pickle.load(file).items():
+                    self.putHdrResults(search, results)
+        path = os.path.join(directory, 'intersections.p')
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                for phenotype, intersection in pickle.load(file).items():
+                    self.putIntersection(phenotype, intersection)
+        self.commit()
+
+    def exportPickles(self, directory: str = 'output') -> None:
+        repoToSteps: Journal[CuratorRepo, list[str]] = Journal(
+            os.path.join(directory, 'repoToSteps.p')
+        )
+        with repoToSteps:
+            for repo, steps in self.getRepoToSteps().items():
+                repoToSteps.put(repo, steps)
+        for similarity in [False, True]:
+            phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] | None = (
+                self.getPhenotypeGroups(similarity)
+            )
+            if phenotypeGroups is not None:
+                with open(
+                    os.path.join(
+                        directory,
+                        (
+                            'similarPhenotypeGroups.p'
+                            if similarity
+                            else 'phenotypeGroups.p'
+                        ),
+                    ),
+                    'wb',
+                ) as f:
+                    pickle.dump(phenotypeGroups, f)
+        with open(os.path.join(directory, 'additionalPhenotypesFromHDR.p'), 'wb') as f:
+            pickle.dump(
+                {
+                    search: json.loads(results)
+                    for search, results in self.__connection.execute(
+                        'SELECT search, results FROM hdr'
+                    )
+                },
+                f,
+            )
+        with open(os.path.join(directory, 'intersections.p'), 'wb') as f:
+            pickle.dump(
+                {
+                    phenotype: self.getIntersection(phenotype)
+                    for phenotype in self.getIntersected()
+                },
+                f,
+            )
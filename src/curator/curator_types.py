@@ -1,3 +1,4 @@
+import re
 from dataclasses import dataclass
 from typing import Any
 
@@ -14,3 +15,39 @@ class CuratorRepo:
 
     def __hash__(self) -> int:
         return hash(self.name + self.about)
+
+
+@dataclass
+class NormalizedRepo:
+    name: str
+    phenotypeName: str
+    nameTokens: list[str]
+    aboutComponents: list[str]
+    stripPattern: re.Pattern[str]
+
+
+@dataclass
+class StepFeatures:
+    name: str
+    components: list[str]
+    negative: bool
+
+
+@dataclass
+class RepoContent:
+    path: str
+    name: str
+    directory: bool
+
+
+@dataclass
+class RepoState:
+    pushedAt: str
+    etag: str | None
+
+
+@dataclass
+class SyncResult:
+    repoToSteps: dict[CuratorRepo, list[str]]
+    changed: list[CuratorRepo]
+    removed: list[CuratorRepo]
@@ -0,0 +1,86 @@
+import logging, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.metrics import Metrics, Progress
+
+
+class HDRClient:
+
+    def __init__(
+        self,
+        url: str = 'https://phenotypes.healthdatagateway.org',
+        workers: int = 8,
+        attempts: int = 5,
+        backoff: float = 1.0,
+        maxBackoff: float = 30.0,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.__logger = logging.getLogger()
+        self.__url: str = url.rstrip('/') + '/api/v1/phenotypes/'
+        self.__workers: int = workers
+        self.__attempts: int = attempts
+        self.__backoff: float = backoff
+        self.__maxBackoff: float = maxBackoff
+        self.__metrics: Metrics = metrics if metrics is not None else Metrics()
+        # one pooled session, so concurrent searches reuse their connections
+        self.__session: requests.Session = requests.Session()
+        self.__session.mount(
+            url, HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        )
+        self.__session.headers['Accept'] = 'application/json'
+
+    def search(self, searchName: str) -> list[Any] | None:
+        # None once every attempt has failed, so the search is tried again next run
+        for attempt in range(self.__attempts):
+            if attempt > 0:
+                delay: float = min(
+                    self.__backoff * 2 ** (attempt - 1), self.__maxBackoff
+                )
+                self.__metrics.increment('hdr retries')
+                time.sleep(delay)
+            try:
+                self.__metrics.increment('hdr calls')
+                with self.__metrics.timer('hdr'):
+                    response: requests.Response = self.__session.get(
+                        self.__url, params={'search': searchName}, timeout=60
+                    )
+                if response.status_code != 429 and response.status_code < 500:
+                    if not response.ok:
+                        self.__logger.error(
+                            'error from hdr in search for '
+                            + searchName
+                            + ': '
+                            + str(response.status_code)
+                        )
+                        return None
+                    results: list[Any] = response.json()
+                    return results
+            except (requests.RequestException, ValueError):
+                pass
+            self.__logger.warning(
+                'error from hdr in search for ' + searchName + ', retrying...'
+            )
+        self.__logger.error(
+            'giving up on hdr search for '
+            + searchName
+            + ' after '
+            + str(self.__attempts)
+            + ' attempts'
+        )
+        return None
+
+    def searchAll(self, searchNames: list[str]) -> dict[str, list[Any]]:
+        searched: dict[str, list[Any]] = {}
+        progress: Progress = self.__metrics.progress('hdr searches', len(searchNames))
+        with ThreadPoolExecutor(self.__workers) as executor:
+            for position, (searchName, results) in enumerate(
+                zip(searchNames, executor.map(self.search, searchNames))
+            ):
+                if results is not None:
+                    searched[searchName] = results
+                progress.update(position + 1)
+        return searched
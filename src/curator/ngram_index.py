@@ -0,0 +1,72 @@
+import math
+from collections import Counter
+from typing import Generic, TypeVar
+
+T = TypeVar('T')
+
+
+class NGramIndex(Generic[T]):
+
+    def __init__(self, threshold: float = 0.9, n: int = 3) -> None:
+        # fuzz.ratio is rounded to a whole percentage before being compared
+        self.__minimumRatio: float = (math.floor(threshold * 100) + 0.5) / 100
+        self.__n: int = n
+        self.__values: list[T] = []
+        self.__lengths: list[int] = []
+        self.__postings: dict[str, list[tuple[int, int]]] = {}
+        self.__byLength: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def __grams(self, key: str) -> Counter[str]:
+        return Counter(
+            key[start : start + self.__n] for start in range(len(key) - self.__n + 1)
+        )
+
+    def __maximumDistance(self, lengthA: int, lengthB: int) -> int:
+        return math.floor((1 - self.__minimumRatio) * (lengthA + lengthB) + 1e-9)
+
+    def __requiredGrams(self, lengthA: int, lengthB: int) -> int:
+        # q-gram lemma: each edit destroys at most n of the shared grams
+        return (
+            max(lengthA, lengthB)
+            - self.__n
+            + 1
+            - self.__n * self.__maximumDistance(lengthA, lengthB)
+        )
+
+    def add(self, key: str, value: T) -> None:
+        entry: int = len(self.__values)
+        self.__values.append(value)
+        self.__lengths.append(len(key))
+        self.__byLength.setdefault(len(key), []).append(entry)
+        for gram, count in self.__grams(key).items():
+            self.__postings.setdefault(gram, []).append((entry, count))
+
+    def candidates(self, key: str) -> list[T]:
+        # values, in the order they were added, whose keys could reach the threshold
+        length: int = len(key)
+        shortest: int = math.ceil(
+            length * self.__minimumRatio / (2 - self.__minimumRatio) - 1e-9
+        )
+        longest: int = math.floor(
+            length * (2 - self.__minimumRatio) / self.__minimumRatio + 1e-9
+        )
+        required: dict[int, int] = {
+            otherLength: self.__requiredGrams(length, otherLength)
+            for otherLength in range(shortest, longest + 1)
+        }
+        entries: set[int] = set()
+        for otherLength, grams in required.items():
+            if grams <= 0:
+                entries.update(self.__byLength.get(otherLength, []))
+        shared: Counter[int] = Counter()
+        for gram, count in self.__grams(key).items():
+            for entry, entryCount in self.__postings.get(gram, []):
+                shared[entry] += min(count, entryCount)
+        for entry, count in shared.items():
+            requiredGrams: int | None = required.get(self.__lengths[entry])
+            if requiredGrams is not None and count >= requiredGrams:
+                entries.add(entry)
+        return [self.__values[entry] for entry in sorted(entries)]
@@ -0,0 +1,49 @@
+from typing import Generic, TypeVar
+
+T = TypeVar('T')
+
+
+class _PrefixNode(Generic[T]):
+
+    __slots__ = ('children', 'first', 'value')
+
+    def __init__(self) -> None:
+        self.children: dict[str, _PrefixNode[T]] = {}
+        self.first: tuple[int, T] | None = None
+        self.value: tuple[int, T] | None = None
+
+
+class PrefixIndex(Generic[T]):
+
+    def __init__(self) -> None:
+        self.__root: _PrefixNode[T] = _PrefixNode()
+        self.__size: int = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def add(self, key: str, value: T) -> None:
+        entry: tuple[int, T] = (self.__size, value)
+        self.__size += 1
+        node: _PrefixNode[T] = self.__root
+        for character in key:
+            node = node.children.setdefault(character, _PrefixNode())
+            if node.first is None:
+                node.first = entry
+        if node.value is None:
+            node.value = entry
+
+    def earliestMatch(self, key: str) -> T | None:
+        # earliest added value whose key is a prefix of key, or has key as a prefix
+        best: tuple[int, T] | None = None
+        node: _PrefixNode[T] = self.__root
+        for character in key:
+            child: _PrefixNode[T] | None = node.children.get(character)
+            if child is None:
+                return best[1] if best is not None else None
+            node = child
+            if node.value is not None and (best is None or node.value[0] < best[0]):
+                best = node.value
+        if node.first is not None and (best is None or node.first[0] < best[0]):
+            best = node.first
+        return best[1] if best is not None else None
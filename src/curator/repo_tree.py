@@ -0,0 +1,31 @@
+from collections import deque
+
+from curator.curator_types import RepoContent
+
+
+class RepoTree:
+
+    def __init__(self) -> None:
+        self.__listings: dict[str, list[RepoContent]] = {}
+
+    def setListing(self, directory: str, contents: list[RepoContent]) -> None:
+        self.__listings[directory] = contents
+
+    def add(self, path: str, directory: bool) -> None:
+        # regrouped by directory, entries keep their relative order within it
+        parent, _, name = path.rpartition('/')
+        self.__listings.setdefault(parent, []).append(
+            RepoContent(path, name, directory)
+        )
+
+    def steps(self) -> list[str]:
+        # replays a breadth-first walk over the listings, so steps keep their order
+        steps: list[str] = []
+        contents: deque[RepoContent] = deque(self.__listings.get('', []))
+        while contents:
+            content: RepoContent = contents.popleft()
+            if content.directory:
+                contents.extend(self.__listings.get(content.path, []))
+            elif '---' in content.name:
+                steps.append(content.name)
+        return steps
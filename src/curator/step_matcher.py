@@ -0,0 +1,128 @@
+from curator.curator_types import CuratorRepo, StepFeatures
+from curator.ngram_index import NGramIndex
+from util.metrics import Progress
+
+
+class StepMatcher:
+
+    def __init__(
+        self, similarityThreshold: float = 0.9, progressInterval: float = 5.0
+    ) -> None:
+        self.__similarityThreshold: float = similarityThreshold
+        self.__progressInterval: float = progressInterval
+
+    def anySimilar(self, stringsA: list[str], stringsB: list[str]) -> bool:
+        if len(stringsA) == 0 or len(stringsB) == 0:
+            return False
+        import numpy
+        from rapidfuzz import fuzz, process
+
+        # scores every pair in one call, rounded to whole percentages like fuzzywuzzy
+        return bool(
+            (
+                numpy.round(process.cdist(stringsA, stringsB, scorer=fuzz.ratio))
+                / 100.0
+                > self.__similarityThreshold
+            ).any()
+        )
+
+    def __similarComponents(
+        self, features: dict[CuratorRepo, list[StepFeatures]]
+    ) -> dict[str, list[str]]:
+        import numpy
+        from rapidfuzz import fuzz, process
+
+        components: list[str] = list(
+            dict.fromkeys(
+                component
+                for steps in features.values()
+                for step in steps
+                for component in step.components
+            )
+        )
+        index: NGramIndex[str] = NGramIndex(self.__similarityThreshold)
+        for component in components:
+            index.add(component, component)
+        similar: dict[str, list[str]] = {}
+        for component in components:
+            candidates: list[str] = index.candidates(component)
+            if not candidates:
+                similar[component] = []
+                continue
+            scores: numpy.ndarray = (
+                numpy.round(process.cdist([component], candidates, scorer=fuzz.ratio))
+                / 100.0
+            )[0]
+            similar[component] = [
+                candidate
+                for candidate, score in zip(candidates, scores)
+                if score > self.__similarityThreshold
+            ]
+        return similar
+
+    def __stepsByComponent(self, steps: list[StepFeatures]) -> dict[str, list[int]]:
+        stepsByComponent: dict[str, list[int]] = {}
+        for stepPosition, step in enumerate(steps):
+            for component in dict.fromkeys(step.components):
+                stepsByComponent.setdefault(component, []).append(stepPosition)
+        return stepsByComponent
+
+    def groupIntersection(
+        self,
+        phenotype: CuratorRepo,
+        siblings: list[CuratorRepo],
+        features: dict[CuratorRepo, list[StepFeatures]],
+        position: int,
+        groups: int,
+    ) -> tuple[dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]], int]:
+        intersection: dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]] = {}
+        similar: dict[str, list[str]] = self.__similarComponents(features)
+        stepsByComponent: dict[CuratorRepo, dict[str, list[int]]] = {
+            workflow: self.__stepsByComponent(steps)
+            for workflow, steps in features.items()
+        }
+        progress: Progress = Progress(
+            'intersections (' + str(position) + ' of ' + str(groups) + ')',
+            len([phenotype] + siblings) * len([phenotype] + siblings),
+            self.__progressInterval,
+        )
+        iteration: int = 1
+        compared: int = 0
+        for workflowA in [phenotype] + siblings:
+            for workflowB in [phenotype] + siblings:
+                if workflowA == workflowB or (workflowB, workflowA) in intersection:
+                    continue
+                progress.update(iteration)
+                iteration += 1
+                for workflowAStep in features[workflowA]:
+                    # only steps sharing a similar component can match, visited in step order
+                    for stepPosition in sorted(
+                        {
+                            stepPosition
+                            for component in workflowAStep.components
+                            for similarComponent in similar[component]
+                            for stepPosition in stepsByComponent[workflowB].get(
+                                similarComponent, []
+                            )
+                        }
+                    ):
+                        workflowBStep: StepFeatures = features[workflowB][stepPosition]
+                        compared += 1
+                        if (
+                            (workflowAStep.name == workflowBStep.name)
+                            or (
+                                (workflowA, workflowB) in intersection
+                                and (
+                                    workflowBStep.name,
+                                    workflowAStep.name,
+                                )
+                                in intersection[(workflowA, workflowB)]
+                            )
+                            or workflowAStep.negative != workflowBStep.negative
+                        ):
+                            continue
+                        # if not workflowAStep.split('---')[1] == workflowBStep.split('---')[1]: continue
+                        intersection.setdefault((workflowA, workflowB), set()).add(
+                            (workflowAStep.name, workflowBStep.name)
+                        )
+        return intersection, compared
@@ -1,26 +1,51 @@
 import logging, re, os, pickle
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
-import spacy  # type: ignore
-from fuzzywuzzy import fuzz  # type: ignore
+from importlib import metadata
+from typing import Any, Iterable, Iterator
 
-from curator.curator_types import CuratorRepo
+from curator.curator_store import CuratorStore
+from curator.curator_types import CuratorRepo, NormalizedRepo, StepFeatures
+from curator.ngram_index import NGramIndex
+from curator.prefix_index import PrefixIndex
+from curator.step_matcher import StepMatcher
+from util.disjoint_set import DisjointSet
+from util.journal import Journal
+from util.metrics import Metrics, Progress
 
 
 class Workflow:
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        flushInterval: int = 100,
+        compactInterval: int = 10000,
+        tagProcesses: int = 1,
+        metrics: Metrics | None = None,
+        storePath: str = 'output/curator.db',
+    ) -> None:
         self.__logger: logging.Logger = logging.getLogger()
-        self.__ignoreInStepNameCache: dict[str, bool] = {}
+        self.__metrics: Metrics = metrics if metrics is not None else Metrics()
+        self.__flushInterval: int = flushInterval
+        self.__compactInterval: int = compactInterval
+        self.__tagProcesses: int = tagProcesses
+        self.__storePath: str = storePath
         self.__cache: dict[tuple[str, str], float] = {}
-        self.__nlp = spacy.load('en_core_web_sm')
+        self.__normalizedRepos: dict[CuratorRepo, NormalizedRepo] = {}
+        self.__workflowFeatureTable: dict[CuratorRepo, list[StepFeatures]] = {}
+        self.__model: str = 'en_core_web_sm'
+        self.__nlp: Any = None
+        self.__ignoreInStepNameCache: dict[str, bool] | None = None
+        self.__savedIgnoreInStepNameCache: int = 0
 
-    def __ignoreInStepName(self, word: str) -> bool:
-        if len(word) == 0:
-            return True
-        if word.isdigit():
-            return False
-        if word in self.__ignoreInStepNameCache:
-            return self.__ignoreInStepNameCache[word]
+    def __getNlp(self) -> Any:
+        if self.__nlp is None:
+            import spacy  # type: ignore
+
+            self.__nlp = spacy.load(self.__model)
+        return self.__nlp
+
+    def __ignore(self, word: str, tag: str) -> bool:
         phenotypeSynonyms: list[str] = [
             'phenotype',
             'syndrome',
@@ -40,8 +65,7 @@ class Workflow:
             'symptoms',
         ]
         ignoreWords: list[str] = ['not', 'use', 'type', 'using', 'anything', 'enjoying']
-        tag: str = self.__nlp(word)[0].pos_
-        ignore: bool = (
+        return (
             len(word) <= 2
             or word.lower() in phenotypeSynonyms + ignoreWords
             or (tag == 'CCONJ' or tag == 'SCONJ')
@@ -49,116 +73,259 @@ class Workflow:
             or tag == 'ADV'
             or re.match(r'.*\dmg$', word) is not None
         )
-        self.__ignoreInStepNameCache[word] = ignore
+
+    def __tag(self, words: list[str]) -> dict[str, str]:
+        if len(words) == 0:
+            return {}
+        nlp: Any = self.__getNlp()
+        # pos_ only needs the tagger and the attribute ruler that maps its tags
+        disable: list[str] = [
+            pipe
+            for pipe in nlp.pipe_names
+            if pipe not in ['tok2vec', 'tagger', 'attribute_ruler', 'morphologizer']
+        ]
+        return {
+            word: doc[0].pos_
+            for word, doc in zip(
+                words,
+                nlp.pipe(
+                    words,
+                    disable=disable,
+                    n_process=self.__tagProcesses if len(words) > 1 else 1,
+                ),
+            )
+        }
+
+    def __ignoreInStepName(self, word: str) -> bool:
+        if len(word) == 0:
+            return True
+        if word.isdigit():
+            return False
+        ignoreInStepNameCache: dict[str, bool] = self.__getIgnoreInStepNameCache()
+        if word in ignoreInStepNameCache:
+            return ignoreInStepNameCache[word]
+        ignore: bool = self.__ignore(word, self.__tag([word])[word])
+        ignoreInStepNameCache[word] = ignore
         return ignore
 
+    def __ignoreInStepNamePath(self) -> str:
+        try:
+            version: str = metadata.version(self.__model)
+        except metadata.PackageNotFoundError:
+            version = self.__getNlp().meta['version']
+        return 'output/ignoreInStepName-' + self.__model + '-' + version + '.p'
+
+    def __getIgnoreInStepNameCache(self) -> dict[str, bool]:
+        # keyed by model version, so a warm cache never needs the model loaded
+        if self.__ignoreInStepNameCache is None:
+            self.__ignoreInStepNameCache = {}
+            path: str = self.__ignoreInStepNamePath()
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    self.__ignoreInStepNameCache = pickle.load(file)
+            self.__savedIgnoreInStepNameCache = len(self.__ignoreInStepNameCache)
+        return self.__ignoreInStepNameCache
+
+    def __saveIgnoreInStepNameCache(self) -> None:
+        if (
+            self.__ignoreInStepNameCache is None
+            or len(self.__ignoreInStepNameCache) == self.__savedIgnoreInStepNameCache
+        ):
+            return
+        with open(self.__ignoreInStepNamePath(), 'wb') as f:
+            pickle.dump(self.__ignoreInStepNameCache, f)
+        self.__savedIgnoreInStepNameCache = len(self.__ignoreInStepNameCache)
+
+    def __tagVocabulary(self, workflows: dict[CuratorRepo, list[str]]) -> None:
+        ignoreInStepNameCache: dict[str, bool] = self.__getIgnoreInStepNameCache()
+        untagged: list[str] = sorted(
+            {
+                word
+                for workflow, steps in workflows.items()
+                for name in [workflow.name] + steps
+                for word in self.__getNameComponents(name)
+                if len(word) > 0
+                and not word.isdigit()
+                and word not in ignoreInStepNameCache
+            }
+        )
+        if len(untagged) == 0:
+            return
+        self.__logger.info('tagging ' + str(len(untagged)) + ' words')
+        # words ignored by the other rules do not need a tag
+        with self.__metrics.timer('tagging'):
+            tags: dict[str, str] = self.__tag(
+                [word for word in untagged if not self.__ignore(word, '')]
+            )
+        self.__metrics.increment('words tagged', len(tags))
+        for word in untagged:
+            ignoreInStepNameCache[word] = self.__ignore(word, tags.get(word, ''))
+        self.__saveIgnoreInStepNameCache()
+
     def __getNameComponents(self, name: str) -> list[str]:
         return name.rsplit('---', 1)[0].split('-') if '---' in name else []
 
     def __compareTwoStrings(self, str1: str, str2: str) -> float:
+        self.__metrics.increment('name comparisons')
         if (str1, str2) in self.__cache:
+            self.__metrics.increment('name comparison cache hits')
             return self.__cache[(str1, str2)]
+        from fuzzywuzzy import fuzz  # type: ignore
+
         similarity: float = fuzz.ratio(str1, str2) / 100.0
         self.__cache[(str1, str2)] = similarity
         return similarity
 
-    def __samePhenotype(
-        self,
-        nameA: str,
-        nameB: str,
-        similarity: bool = False,
-        simlarityThreshold: float = 0.9,
-    ) -> bool:
-
-        def clean(input: str) -> str:
-            return re.sub(r'[^a-zA-Z0-9]', '', input.lower())
-
-        nameA = ' '.join(
-            list(
-                filter(
-                    lambda word: not self.__ignoreInStepName(word),
-                    self.__getNameComponents(nameA),
-                )
-            )
+    def __normalize(self, workflow: CuratorRepo) -> NormalizedRepo:
+        if workflow in self.__normalizedRepos:
+            return self.__normalizedRepos[workflow]
+        nameComponents: list[str] = self.__getNameComponents(workflow.name)
+        nameTokens: list[str] = list(
+            filter(lambda word: not self.__ignoreInStepName(word), nameComponents)
         )
-        nameB = ' '.join(
-            list(
-                filter(
-                    lambda word: not self.__ignoreInStepName(word),
-                    self.__getNameComponents(nameB),
-                )
-            )
+        name: str = '-'.join(nameComponents).lower()
+        aboutComponents: list[str] = self.__getAboutComponents(
+            re.sub(r'(\w)--(\w)', r'\1-\2', workflow.about)
         )
-        nameA = clean(nameA)
-        nameB = clean(nameB)
-        return (
-            len(nameA) > 0
-            and len(nameB) > 0
-            and (
-                (
-                    self.__compareTwoStrings(nameA, nameB) > simlarityThreshold
-                    if similarity
-                    else False
+        normalizedRepo: NormalizedRepo = NormalizedRepo(
+            name,
+            re.sub(r'[^a-zA-Z0-9]', '', ' '.join(nameTokens).lower()),
+            nameTokens,
+            aboutComponents,
+            re.compile(
+                '|'.join(
+                    map(
+                        re.escape,
+                        [component + '-' for component in aboutComponents]
+                        + [name + '-'],
+                    )
                 )
-                or nameA.startswith(nameB)
-                or nameB.startswith(nameA)
-            )
+            ),
         )
+        self.__normalizedRepos[workflow] = normalizedRepo
+        return normalizedRepo
 
-    def getPhenotypeGroups(
+    def __normalizeAll(
         self, workflows: dict[CuratorRepo, list[str]]
-    ) -> dict[CuratorRepo, list[CuratorRepo]]:
-        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {}
-        path: str = 'output/phenotypeGroups.p'
-        if os.path.exists(path):
-            with open(path, 'rb') as file:
-                phenotypeGroups = pickle.load(file)
-                self.__logger.debug(phenotypeGroups)
-                self.__logger.info(
-                    'returning ' + str(len(phenotypeGroups)) + ' phenotype groups'
-                )
-                return phenotypeGroups
-        iteration: int = 1
-        groupedWorkflows: list[CuratorRepo] = []
-        for workflowA in list(workflows.keys()):
-            if workflowA in [
-                phenotype
-                for sublist in list(phenotypeGroups.values())
-                for phenotype in sublist
-            ]:
+    ) -> dict[CuratorRepo, NormalizedRepo]:
+        self.__tagVocabulary(workflows)
+        for workflow in workflows.keys():
+            self.__normalize(workflow)
+        return self.__normalizedRepos
+
+    def __groupPhenotypes(
+        self,
+        grouping: DisjointSet[CuratorRepo],
+        workflows: list[CuratorRepo],
+        similarity: bool,
+        similarityThreshold: float,
+        journal: Journal[CuratorRepo, CuratorRepo],
+    ) -> None:
+        # a workflow joins the group of the earliest ungrouped workflow whose name is
+        # a prefix of (or prefixed by, or similar to) its own, so only those need to be
+        # indexed, and adding workflows never regroups those already in the grouping
+        leads: PrefixIndex[CuratorRepo] = PrefixIndex()
+        similarLeads: NGramIndex[CuratorRepo] = NGramIndex(similarityThreshold)
+        positions: dict[CuratorRepo, int] = {}
+
+        def addLead(workflow: CuratorRepo, name: str) -> None:
+            leads.add(name, workflow)
+            if similarity:
+                similarLeads.add(name, workflow)
+            positions[workflow] = len(positions)
+
+        for workflow in grouping:
+            name: str = self.__normalize(workflow).phenotypeName
+            if len(name) > 0 and grouping.find(workflow) == workflow:
+                addLead(workflow, name)
+        ungrouped: list[CuratorRepo] = [
+            workflow for workflow in workflows if workflow not in grouping
+        ]
+        progress: Progress = self.__metrics.progress('grouping', len(ungrouped))
+        for iteration, workflow in enumerate(ungrouped, 1):
+            progress.update(iteration)
+            grouping.add(workflow)
+            name = self.__normalize(workflow).phenotypeName
+            if len(name) == 0:
+                journal.put(workflow, workflow)
                 continue
-            for workflowB in list(workflows.keys()):
-                self.__logger.info(
-                    str(
-                        round(
-                            (
-                                iteration
-                                / (
-                                    len(list(workflows.keys()))
-                                    * len(list(workflows.keys()))
-                                )
-                            )
-                            * 100,
-                            2,
+            lead: CuratorRepo | None = leads.earliestMatch(name)
+            if similarity:
+                for candidate in similarLeads.candidates(name):
+                    if lead is not None and positions[lead] < positions[candidate]:
+                        break
+                    if (
+                        self.__compareTwoStrings(
+                            self.__normalize(candidate).phenotypeName, name
                         )
-                    )
-                    + '%',
-                )
-                iteration += 1
-                if workflowA == workflowB or workflowB in [
-                    phenotype
-                    for sublist in list(phenotypeGroups.items())
-                    for phenotype in sublist
-                ]:
-                    continue
-                if (
-                    self.__samePhenotype(workflowA.name, workflowB.name)
-                    and workflowB not in groupedWorkflows
-                ):
-                    phenotypeGroups.setdefault(workflowA, []).append(workflowB)
-                    groupedWorkflows.append(workflowB)
-                    with open(path, 'wb') as f:
-                        pickle.dump(phenotypeGroups, f)
+                        > similarityThreshold
+                    ):
+                        lead = candidate
+                        break
+            if lead is None:
+                addLead(workflow, name)
+            else:
+                grouping.union(lead, workflow)
+            journal.put(workflow, grouping.find(workflow))
+
+    def __phenotypeGroups(
+        self, grouping: DisjointSet[CuratorRepo]
+    ) -> dict[CuratorRepo, list[CuratorRepo]]:
+        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {}
+        for workflow in grouping:
+            if (lead := grouping.find(workflow)) != workflow:
+                phenotypeGroups.setdefault(lead, []).append(workflow)
+        return {
+            workflow: phenotypeGroups[workflow]
+            for workflow in grouping
+            if workflow in phenotypeGroups
+        }
+
+    def getPhenotypeGroups(
+        self,
+        workflows: dict[CuratorRepo, list[str]],
+        similarity: bool = False,
+        similarityThreshold: float = 0.9,
+    ) -> dict[CuratorRepo, list[CuratorRepo]]:
+        with self.__store() as store:
+            phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] | None = (
+                store.getPhenotypeGroups(similarity)
+            )
+        if phenotypeGroups is not None:
+            self.__metrics.increment('phenotype group cache hits')
+            self.__logger.debug(phenotypeGroups)
+            self.__logger.info(
+                'returning ' + str(len(phenotypeGroups)) + ' phenotype groups'
+            )
+            return phenotypeGroups
+        return self.addToPhenotypeGroups(workflows, similarity, similarityThreshold)
+
+    def addToPhenotypeGroups(
+        self,
+        workflows: dict[CuratorRepo, list[str]],
+        similarity: bool = False,
+        similarityThreshold: float = 0.9,
+    ) -> dict[CuratorRepo, list[CuratorRepo]]:
+        path: str = 'output/similarPhenotype' if similarity else 'output/phenotype'
+        journal: Journal[CuratorRepo, CuratorRepo] = Journal(
+            path + 'Grouping.p', self.__flushInterval, self.__compactInterval
+        )
+        with journal, self.__metrics.timer('grouping'):
+            grouping: DisjointSet[CuratorRepo] = DisjointSet(journal.load())
+            self.__normalizeAll(workflows)
+            self.__groupPhenotypes(
+                grouping,
+                list(workflows.keys()),
+                similarity,
+                similarityThreshold,
+                journal,
+            )
+        self.__metrics.increment('workflows grouped', len(grouping))
+        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = self.__phenotypeGroups(
+            grouping
+        )
+        with self.__store() as store:
+            store.putPhenotypeGroups(phenotypeGroups, similarity)
         self.__logger.debug(phenotypeGroups)
         self.__logger.info(
             'returning ' + str(len(phenotypeGroups)) + ' phenotype groups'
@@ -189,6 +356,34 @@ class Workflow:
             or any([word.startswith('un') for word in words])
         )
 
+    def __stepFeatures(self, workflow: CuratorRepo, step: str) -> StepFeatures:
+        return StepFeatures(
+            step,
+            [
+                component
+                for component in self.__getNameComponents(
+                    re.sub(
+                        r'(\w)--(\w)',
+                        r'\1-\2',
+                        self.__normalize(workflow).stripPattern.sub('', step),
+                    )
+                )
+                if not self.__ignoreInStepName(component)
+            ],
+            self._isNegative(' '.join(self.__getNameComponents(step))),
+        )
+
+    def __workflowFeatures(
+        self, workflow: CuratorRepo, steps: list[str]
+    ) -> list[StepFeatures]:
+        if workflow not in self.__workflowFeatureTable:
+            self.__workflowFeatureTable[workflow] = [
+                self.__stepFeatures(workflow, step)
+                for step in steps
+                if step.endswith('.cwl') and 'load' not in step and 'output' not in step
+            ]
+        return self.__workflowFeatureTable[workflow]
+
     def _workflowStepAnalysis(
         self,
         workflowA: CuratorRepo,
@@ -197,213 +392,132 @@ class Workflow:
         workflowBStep: str,
         similarityThreshold: float = 0.9,
     ) -> bool:
-
-        def clean(input: str) -> str:
-            return re.sub(r'(\w)--(\w)', r'\1-\2', input)
-
-        def workflowName(workflow: CuratorRepo) -> str:
-            return '-'.join(self.__getNameComponents(workflow.name)).lower()
-
-        def workflowAboutComponents(workflow: CuratorRepo) -> list[str]:
-            return self.__getAboutComponents(clean(workflow.about))
-
-        def workflowStepNameComponents(
-            workflowName: str, workflowAboutComponents: list[str], workflowStep: str
-        ) -> list[str]:
-            replace: str = '|'.join(
-                map(
-                    re.escape,
-                    list(
-                        map(
-                            lambda component: component + '-',
-                            workflowAboutComponents,
-                        )
-                    )
-                    + [workflowName + '-'],
-                )
-            )
-            self.__logger.debug('replacing: ' + replace)
-            return self.__getNameComponents(
-                clean(
-                    re.sub(
-                        replace,
-                        '',
-                        workflowStep,
-                    )
-                )
-            )
-
-        self.__logger.debug(str(workflowA) + ' ' + workflowAStep)
-        workflowAName: str = workflowName(workflowA)
-        workflowAAboutComponents: list[str] = workflowAboutComponents(workflowA)
-        workflowAStepNameComponents: list[str] = workflowStepNameComponents(
-            workflowAName, workflowAAboutComponents, workflowAStep
+        workflowAStepFeatures: StepFeatures = self.__stepFeatures(
+            workflowA, workflowAStep
         )
-        self.__logger.debug(
-            workflowAName
-            + ' '
-            + str(workflowAAboutComponents)
-            + ' '
-            + str(workflowA)
-            + ' '
-            + workflowAStep
-            + ' '
-            + str(workflowAStepNameComponents)
+        workflowBStepFeatures: StepFeatures = self.__stepFeatures(
+            workflowB, workflowBStep
         )
-        for workflowAStepNameComponent in workflowAStepNameComponents:
-            if self.__ignoreInStepName(workflowAStepNameComponent):
-                continue
-            self.__logger.debug(str(workflowB) + ' ' + workflowBStep)
-            workflowBName: str = workflowName(workflowB)
-            workflowBAboutComponents: list[str] = workflowAboutComponents(workflowB)
-            workflowBStepNameComponents: list[str] = workflowStepNameComponents(
-                workflowBName, workflowBAboutComponents, workflowBStep
-            )
+        if self.__logger.isEnabledFor(logging.DEBUG):
             self.__logger.debug(
-                workflowBName
+                str(workflowA)
                 + ' '
-                + str(workflowBAboutComponents)
+                + str(workflowAStepFeatures)
                 + ' '
                 + str(workflowB)
                 + ' '
-                + workflowBStep
-                + ' '
-                + str(workflowBStepNameComponents)
+                + str(workflowBStepFeatures)
             )
-            for workflowBStepNameComponent in workflowBStepNameComponents:
-                if self.__ignoreInStepName(workflowBStepNameComponent):
-                    continue
-                self.__logger.debug(
-                    '\n\ncomparing '
-                    + workflowAStepNameComponent
-                    + ' and '
-                    + workflowBStepNameComponent
-                )
-                if (
-                    self.__compareTwoStrings(
-                        workflowAStepNameComponent, workflowBStepNameComponent
-                    )
-                    > similarityThreshold
-                ):
-                    return True
-                else:
-                    self.__logger.debug(
-                        'no match because similarity not high enough: '
-                        + workflowAStepNameComponent.lower()
-                        + ' '
-                        + workflowA.name.lower()
-                        + ' '
-                        + workflowBStepNameComponent.lower()
-                        + ' '
-                        + workflowB.name.lower()
+        return StepMatcher(similarityThreshold).anySimilar(
+            workflowAStepFeatures.components, workflowBStepFeatures.components
+        )
+
+    def __groupFeatures(
+        self,
+        workflows: dict[CuratorRepo, list[str]],
+        phenotype: CuratorRepo,
+        siblings: list[CuratorRepo],
+    ) -> dict[CuratorRepo, list[StepFeatures]]:
+        return {
+            workflow: self.__workflowFeatures(workflow, workflows[workflow])
+            for workflow in [phenotype] + siblings
+        }
+
+    def __intersect(
+        self,
+        workflows: dict[CuratorRepo, list[str]],
+        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]],
+        pending: dict[CuratorRepo, list[CuratorRepo]],
+        store: CuratorStore,
+        jobs: int,
+    ) -> None:
+        self.__normalizeAll(workflows)
+        stepMatcher: StepMatcher = StepMatcher(
+            progressInterval=self.__metrics.progressInterval()
+        )
+        positions: dict[CuratorRepo, int] = {
+            phenotype: position for position, phenotype in enumerate(phenotypeGroups)
+        }
+        # features are computed up front so workers only need rapidfuzz, not spaCy
+        features: list[dict[CuratorRepo, list[StepFeatures]]] = [
+            self.__groupFeatures(workflows, phenotype, siblings)
+            for phenotype, siblings in pending.items()
+        ]
+        arguments: tuple[Iterable[Any], ...] = (
+            pending.keys(),
+            pending.values(),
+            features,
+            [positions[phenotype] for phenotype in pending],
+            [len(phenotypeGroups)] * len(pending),
+        )
+        with self.__metrics.timer('intersections'):
+            if jobs > 1:
+                with ProcessPoolExecutor(jobs) as executor:
+                    self.__putIntersections(
+                        store,
+                        pending,
+                        executor.map(stepMatcher.groupIntersection, *arguments),
                     )
-        self.__logger.debug('no match')
-        return False
+            else:
+                self.__putIntersections(
+                    store, pending, map(stepMatcher.groupIntersection, *arguments)
+                )
+        self.__saveIgnoreInStepNameCache()
+
+    def __store(self) -> CuratorStore:
+        return CuratorStore(self.__storePath, self.__flushInterval)
+
+    def __putIntersections(
+        self,
+        store: CuratorStore,
+        phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]],
+        results: Iterator[
+            tuple[dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]], int]
+        ],
+    ) -> None:
+        # results arrive in group order, however the workers finish
+        for phenotype, (intersection, compared) in zip(phenotypeGroups.keys(), results):
+            store.putIntersection(phenotype, intersection)
+            self.__metrics.increment('groups intersected')
+            self.__metrics.increment('step pairs compared', compared)
+            self.__metrics.increment(
+                'step pairs matched', sum(map(len, intersection.values()))
+            )
+
+    def getIntersection(
+        self, phenotype: CuratorRepo
+    ) -> dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]] | None:
+        with self.__store() as store:
+            return store.getIntersection(phenotype)
 
     def getIntersections(
         self,
         workflows: dict[CuratorRepo, list[str]],
         phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]],
+        jobs: int = 1,
     ) -> dict[CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]]:
         intersections: dict[
             CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
         ] = {}
-        path: str = 'output/intersections.p'
-        if os.path.exists(path):
-            with open(path, 'rb') as file:
-                intersections = pickle.load(file)
-                self.__logger.debug(intersections)
-                self.__logger.info(
-                    'returning '
-                    + str(
-                        reduce(
-                            lambda acc, curr: acc + len(curr),
-                            list(intersections.values()),
-                            0,
-                        )
-                    )
-                    + ' repos with common steps'
-                )
-                return intersections
-        for phenotype, siblings in phenotypeGroups.items():
-            intersection: dict[
-                tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]
-            ] = {}
-            iteration: int = 1
-            for workflowA in [phenotype] + siblings:
-                for workflowB in [phenotype] + siblings:
-                    if workflowA == workflowB or (workflowB, workflowA) in intersection:
-                        continue
-                    self.__logger.info(
-                        str(
-                            round(
-                                (
-                                    iteration
-                                    / (
-                                        len([phenotype] + siblings)
-                                        * len([phenotype] + siblings)
-                                    )
-                                )
-                                * 100,
-                                2,
-                            )
-                        )
-                        + '% ('
-                        + str(list(phenotypeGroups.keys()).index(phenotype))
-                        + ' of '
-                        + str(len(phenotypeGroups))
-                        + ')',
-                    )
-                    iteration += 1
-                    for workflowAStep in list(
-                        filter(
-                            lambda sibling: sibling.endswith('.cwl'),
-                            workflows[workflowA],
-                        )
-                    ):
-                        if 'load' in workflowAStep or 'output' in workflowAStep:
-                            continue
-                        for workflowBStep in list(
-                            filter(
-                                lambda sibling: sibling.endswith('.cwl'),
-                                workflows[workflowB],
-                            )
-                        ):
-                            if (
-                                ('load' in workflowBStep or 'output' in workflowBStep)
-                                or (workflowAStep == workflowBStep)
-                                or (
-                                    (workflowA, workflowB) in intersection
-                                    and (
-                                        workflowBStep,
-                                        workflowAStep,
-                                    )
-                                    in intersection[(workflowA, workflowB)]
-                                )
-                                or (
-                                    not self._isNegative(
-                                        ' '.join(
-                                            self.__getNameComponents(workflowAStep)
-                                        )
-                                    )
-                                    == self._isNegative(
-                                        ' '.join(
-                                            self.__getNameComponents(workflowBStep)
-                                        )
-                                    )
-                                )
-                            ):
-                                continue
-                            # if not workflowAStep.split('---')[1] == workflowBStep.split('---')[1]: continue
-                            if self._workflowStepAnalysis(
-                                workflowA, workflowAStep, workflowB, workflowBStep
-                            ):
-                                intersection.setdefault(
-                                    (workflowA, workflowB), set()
-                                ).add((workflowAStep, workflowBStep))
-            intersections[phenotype] = intersection
-            with open(path, 'wb') as f:
-                pickle.dump(intersections, f)
+        with self.__store() as store:
+            intersected: set[CuratorRepo] = set(store.getIntersected())
+            # groups finished by an earlier run are read back rather than recomputed
+            pending: dict[CuratorRepo, list[CuratorRepo]] = {
+                phenotype: siblings
+                for phenotype, siblings in phenotypeGroups.items()
+                if phenotype not in intersected
+            }
+            self.__metrics.increment(
+                'groups resumed', len(phenotypeGroups) - len(pending)
+            )
+            if len(pending):
+                self.__intersect(workflows, phenotypeGroups, pending, store, jobs)
+            for phenotype in phenotypeGroups:
+                intersection: (
+                    dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]] | None
+                ) = store.getIntersection(phenotype)
+                if intersection is not None:
+                    intersections[phenotype] = intersection
         self.__logger.debug(intersections)
         self.__logger.info(
             'returning '
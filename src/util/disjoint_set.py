@@ -0,0 +1,35 @@
+from typing import Generic, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+class DisjointSet(Generic[T]):
+
+    def __init__(self, parents: dict[T, T] | None = None) -> None:
+        self.__parents: dict[T, T] = dict(parents) if parents else {}
+
+    def __contains__(self, item: object) -> bool:
+        return item in self.__parents
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.__parents)
+
+    def __len__(self) -> int:
+        return len(self.__parents)
+
+    def add(self, item: T) -> None:
+        self.__parents.setdefault(item, item)
+
+    def find(self, item: T) -> T:
+        root: T = item
+        while self.__parents[root] != root:
+            root = self.__parents[root]
+        while self.__parents[item] != root:
+            self.__parents[item], item = root, self.__parents[item]
+        return root
+
+    def union(self, root: T, item: T) -> T:
+        # the representative of root's set stays the representative of the union
+        representative: T = self.find(root)
+        self.__parents[self.find(item)] = representative
+        return representative
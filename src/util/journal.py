@@ -0,0 +1,100 @@
+import os, pickle
+from types import TracebackType
+from typing import Generic, TypeVar
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+
+class Journal(Generic[K, V]):
+
+    def __init__(
+        self, path: str, flushInterval: int = 100, compactInterval: int = 10000
+    ) -> None:
+        self.__path: str = path
+        self.__logPath: str = os.path.splitext(path)[0] + '.journal'
+        self.__flushInterval: int = flushInterval
+        self.__compactInterval: int = compactInterval
+        self.__state: dict[K, V] = {}
+        # a record of just the key marks its removal
+        self.__pending: list[tuple[K, V] | tuple[K]] = []
+        self.__uncompacted: int = 0
+
+    def __enter__(self) -> 'Journal[K, V]':
+        return self
+
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__state
+
+    def __len__(self) -> int:
+        return len(self.__state)
+
+    def load(self) -> dict[K, V]:
+        self.__state = {}
+        if os.path.exists(self.__path):
+            with open(self.__path, 'rb') as file:
+                self.__state = pickle.load(file)
+        if os.path.exists(self.__logPath):
+            with open(self.__logPath, 'rb+') as file:
+                end: int = 0
+                while True:
+                    try:
+                        record: tuple[K, V] | tuple[K] = pickle.load(file)
+                    except (EOFError, pickle.UnpicklingError):
+                        break
+                    if len(record) == 2:
+                        self.__state[record[0]] = record[1]
+                    else:
+                        self.__state.pop(record[0], None)
+                    self.__uncompacted += 1
+                    end = file.tell()
+                # drop any record cut short by an interrupted flush
+                file.truncate(end)
+        return self.__state
+
+    def put(self, key: K, value: V) -> None:
+        self.__state[key] = value
+        self.__record((key, value))
+
+    def remove(self, key: K) -> None:
+        if key not in self.__state:
+            return
+        del self.__state[key]
+        self.__record((key,))
+
+    def __record(self, record: tuple[K, V] | tuple[K]) -> None:
+        self.__pending.append(record)
+        self.__uncompacted += 1
+        if self.__uncompacted >= self.__compactInterval:
+            self.compact()
+        elif len(self.__pending) >= self.__flushInterval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.__pending:
+            return
+        with open(self.__logPath, 'ab') as f:
+            for record in self.__pending:
+                pickle.dump(record, f)
+        self.__pending = []
+
+    def compact(self) -> None:
+        with open(self.__path + '.tmp', 'wb') as f:
+            pickle.dump(self.__state, f)
+        os.replace(self.__path + '.tmp', self.__path)
+        if os.path.exists(self.__logPath):
+            os.remove(self.__logPath)
+        self.__pending = []
+        self.__uncompacted = 0
+
+    def close(self) -> None:
+        if self.__uncompacted > 0:
+            self.compact()
@@ -0,0 +1,77 @@
+import json, logging, threading, time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class Progress:
+
+    def __init__(self, stage: str, total: int, interval: float = 5.0) -> None:
+        self.__logger: logging.Logger = logging.getLogger()
+        self.__stage: str = stage
+        self.__total: int = total
+        self.__interval: float = interval
+        self.__reported: float = float('-inf')
+
+    def update(self, done: int) -> None:
+        now: float = time.monotonic()
+        # the final update is always reported so a finished stage is visible
+        if done < self.__total and now - self.__reported < self.__interval:
+            return
+        self.__reported = now
+        self.__logger.info(
+            self.__stage
+            + ': '
+            + str(round(done / self.__total * 100, 2) if self.__total else 100.0)
+            + '% ('
+            + str(done)
+            + ' of '
+            + str(self.__total)
+            + ')'
+        )
+
+
+class Metrics:
+
+    def __init__(self, progressInterval: float = 5.0) -> None:
+        self.__progressInterval: float = progressInterval
+        self.__counters: dict[str, int] = {}
+        self.__timers: dict[str, dict[str, float]] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    def progressInterval(self) -> float:
+        return self.__progressInterval
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + amount
+
+    def counter(self, name: str) -> int:
+        return self.__counters.get(name, 0)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed: float = time.perf_counter() - start
+            with self.__lock:
+                timer: dict[str, float] = self.__timers.setdefault(
+                    name, {'calls': 0, 'seconds': 0.0}
+                )
+                timer['calls'] += 1
+                timer['seconds'] += elapsed
+
+    def progress(self, stage: str, total: int) -> Progress:
+        return Progress(stage, total, self.__progressInterval)
+
+    def toDict(self) -> dict[str, Any]:
+        with self.__lock:
+            return {
+                'counters': dict(self.__counters),
+                'timers': {name: dict(timer) for name, timer in self.__timers.items()},
+            }
+
+    def export(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.toDict(), f, indent=2)
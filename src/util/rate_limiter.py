@@ -0,0 +1,71 @@
+import threading, time
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        rate: float = 12.0,
+        burst: int = 100,
+        limit: int = 5000,
+        reserve: int = 10,
+    ) -> None:
+        # at 12 a second with bursts of 100, no minute exceeds 820 requests, below the
+        # 900 github allows before its secondary limit refuses them
+        self.__lock: threading.Lock = threading.Lock()
+        self.__rate: float = rate
+        self.__burst: int = burst
+        self.__limit: int = limit
+        self.__reserve: int = reserve
+        self.__tokens: float = burst
+        self.__refilled: float = time.monotonic()
+        # until a response reports otherwise, assume a full window of quota
+        self.__quota: int = limit - reserve
+        self.__reset: float = 0.0
+        self.__resetAt: float = 0.0
+        self.__resumeAt: float = 0.0
+
+    def __refill(self, now: float) -> None:
+        self.__tokens = min(
+            self.__burst, self.__tokens + (now - self.__refilled) * self.__rate
+        )
+        self.__refilled = now
+
+    def acquire(self) -> float:
+        # blocks while a pause is in force, the quota is spent or the bucket is empty,
+        # returning how long that took
+        waited: float = 0.0
+        while True:
+            with self.__lock:
+                now: float = time.monotonic()
+                wait: float = self.__resumeAt - now
+                if wait <= 0 and self.__quota < 1:
+                    if now >= self.__resetAt:
+                        # a new window has opened since the quota ran out
+                        self.__quota = self.__limit - self.__reserve
+                    else:
+                        wait = self.__resetAt - now
+                if wait <= 0:
+                    self.__refill(now)
+                    if self.__tokens >= 1:
+                        self.__tokens -= 1
+                        self.__quota -= 1
+                        return waited
+                    wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, remaining: int, reset: float) -> None:
+        # remaining and reset (epoch seconds) as reported by the last response
+        with self.__lock:
+            if reset != self.__reset:
+                self.__reset = reset
+                self.__resetAt = time.monotonic() + max(reset - time.time(), 0.0) + 1
+                self.__quota = remaining - self.__reserve
+            else:
+                # within a window remaining only falls, so a late response is ignored
+                self.__quota = min(self.__quota, remaining - self.__reserve)
+
+    def pause(self, seconds: float) -> None:
+        with self.__lock:
+            self.__resumeAt = max(self.__resumeAt, time.monotonic() + seconds)
@@ -6,12 +6,18 @@ class TestCurator(Curator):
 
     __test__ = False
 
+    def prefetchFromHDR(self, leadPhenotypes: list[CuratorRepo]) -> None:
+        super()._prefetchFromHDR(leadPhenotypes)
+
+    def phenotypeIndex(self, repos: list[CuratorRepo]) -> dict[str, CuratorRepo]:
+        return super()._phenotypeIndex(repos)
+
     def additionalPhenotypesFromHDR(
         self,
         phenotypeGroup: tuple[CuratorRepo, list[CuratorRepo]],
-        repos: list[CuratorRepo],
+        phenotypeIndex: dict[str, CuratorRepo],
     ) -> list[CuratorRepo]:
-        return super()._additionalPhenotypesFromHDR(phenotypeGroup, repos)
+        return super()._additionalPhenotypesFromHDR(phenotypeGroup, phenotypeIndex)
 
     def removeUnrelatedPhenotypesUsingLLM(
         self, leadPhenotype: CuratorRepo, phenotypes: list[CuratorRepo]
@@ -23,5 +29,13 @@ class TestCurator(Curator):
         possibleDuplicates: list[CuratorRepo],
         phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]],
         ignore: list[CuratorRepo],
+        memberIndex: dict[CuratorRepo, set[CuratorRepo]] | None = None,
     ) -> dict[CuratorRepo, list[CuratorRepo]]:
-        return super()._removeDuplicates(possibleDuplicates, phenotypeGroups, ignore)
+        return super()._removeDuplicates(
+            possibleDuplicates, phenotypeGroups, ignore, memberIndex
+        )
+
+    def memberIndex(
+        self, phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]]
+    ) -> dict[CuratorRepo, set[CuratorRepo]]:
+        return super()._memberIndex(phenotypeGroups)
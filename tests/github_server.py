@@ -0,0 +1,171 @@
+import datetime, hashlib, json, threading, time, urllib.parse, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any
+
+
+class GithubServer:
+
+    __test__ = False
+
+    def __init__(
+        self,
+        repos: dict[str, tuple[str, list[str]]],
+        truncated: set[str] | None = None,
+        limited: int = 0,
+        slow: dict[str, float] | None = None,
+    ) -> None:
+        # repo name -> (description, paths of the files in the repo)
+        self.repos: dict[str, tuple[str, list[str]]] = repos
+        self.truncated: set[str] = truncated if truncated is not None else set()
+        # the first limited repo requests are refused with a secondary rate limit
+        self.limited: int = limited
+        # repo name -> seconds each of its requests is held back
+        self.slow: dict[str, float] = slow if slow is not None else {}
+        self.__lock: threading.Lock = threading.Lock()
+        self.requests: list[str] = []
+        self.statuses: list[int] = []
+        self.__server: ThreadingHTTPServer = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self.__handler()
+        )
+        self.url: str = 'http://127.0.0.1:' + str(self.__server.server_address[1])
+        self.__thread: threading.Thread = threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        )
+
+    def __enter__(self) -> 'GithubServer':
+        self.__thread.start()
+        return self
+
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __repo(self, name: str) -> dict[str, Any]:
+        return {
+            'name': name,
+            'full_name': 'phenoflow/' + name,
+            'url': self.url + '/repos/phenoflow/' + name,
+            'description': self.repos[name][0],
+            'default_branch': 'main',
+            # moves whenever the files in the repo change
+            'pushed_at': datetime.datetime.fromtimestamp(
+                zlib.crc32(json.dumps(self.repos[name][1]).encode()),
+                datetime.timezone.utc,
+            ).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+
+    def __content(self, name: str, path: str, type: str) -> dict[str, Any]:
+        return {
+            'type': type,
+            'name': path.rsplit('/', 1)[-1],
+            'path': path,
+            'sha': path,
+            'size': 0,
+            'url': self.url + '/repos/phenoflow/' + name + '/contents/' + path,
+        }
+
+    def __contents(self, name: str, directory: str) -> list[dict[str, Any]] | None:
+        prefix: str = directory + '/' if directory else ''
+        children: dict[str, dict[str, Any]] = {}
+        for path in self.repos[name][1]:
+            if not path.startswith(prefix):
+                continue
+            child: str = path[len(prefix) :].split('/', 1)[0]
+            if child not in children:
+                children[child] = self.__content(
+                    name,
+                    prefix + child,
+                    'file' if prefix + child == path else 'dir',
+                )
+        return list(children.values()) if children or not directory else None
+
+    def __tree(self, name: str, directory: str) -> list[dict[str, Any]]:
+        tree: list[dict[str, Any]] = []
+        for content in self.__contents(name, directory) or []:
+            tree.append(
+                {
+                    'path': content['path'],
+                    'mode': '040000' if content['type'] == 'dir' else '100644',
+                    'type': 'tree' if content['type'] == 'dir' else 'blob',
+                    'sha': content['sha'],
+                }
+            )
+            if content['type'] == 'dir':
+                tree.extend(self.__tree(name, content['path']))
+        return tree
+
+    def get(self, path: str, query: dict[str, list[str]]) -> tuple[int, Any]:
+        parts: list[str] = [urllib.parse.unquote(part) for part in path.split('/')]
+        if path == '/rate_limit':
+            core: dict[str, int] = {
+                'limit': 5000,
+                'remaining': 5000,
+                'reset': int(time.time()) + 3600,
+                'used': 0,
+            }
+            return 200, {'resources': {'core': core}, 'rate': core}
+        if path == '/orgs/phenoflow':
+            return 200, {'login': 'phenoflow', 'url': self.url + '/orgs/phenoflow'}
+        if path == '/orgs/phenoflow/repos':
+            page: int = int(query.get('page', ['1'])[0])
+            perPage: int = int(query.get('per_page', ['30'])[0])
+            return 200, [
+                self.__repo(name)
+                for name in list(self.repos)[(page - 1) * perPage : page * perPage]
+            ]
+        if len(parts) >= 5 and parts[1] == 'repos' and parts[3] in self.repos:
+            time.sleep(self.slow.get(parts[3], 0.0))
+            with self.__lock:
+                if self.limited > 0:
+                    self.limited -= 1
+                    return 403, {'message': 'You have exceeded a secondary rate limit.'}
+            if parts[4] == 'contents':
+                contents: list[dict[str, Any]] | None = self.__contents(
+                    parts[3], '/'.join(parts[5:]).strip('/')
+                )
+                return (200, contents) if contents is not None else (404, {})
+            if parts[4:6] == ['git', 'trees'] and query.get('recursive') == ['1']:
+                return 200, {
+                    'sha': parts[6],
+                    'url': self.url + path,
+                    'tree': self.__tree(parts[3], ''),
+                    'truncated': parts[3] in self.truncated,
+                }
+        return 404, {'message': 'Not Found'}
+
+    def __handler(self) -> type[BaseHTTPRequestHandler]:
+        server: GithubServer = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                url: urllib.parse.SplitResult = urllib.parse.urlsplit(self.path)
+                server.requests.append(url.path)
+                status, body = server.get(url.path, urllib.parse.parse_qs(url.query))
+                encoded: bytes = json.dumps(body).encode()
+                etag: str = '"' + hashlib.sha1(encoded).hexdigest() + '"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, encoded = 304, b''
+                server.statuses.append(status)
+                self.send_response(status)
+                self.send_header('ETag', etag)
+                if status == 403:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.send_header('X-RateLimit-Limit', '5000')
+                self.send_header('X-RateLimit-Remaining', '5000')
+                self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
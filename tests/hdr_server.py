@@ -0,0 +1,71 @@
+import json, threading, urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any
+
+
+class HDRServer:
+
+    __test__ = False
+
+    def __init__(self, phenotypes: dict[str, list[str]], failing: int = 0) -> None:
+        # search name -> ids of the phenotypes it finds
+        self.phenotypes: dict[str, list[str]] = phenotypes
+        # the first failing searches are answered with an error page rather than json
+        self.failing: int = failing
+        self.__lock: threading.Lock = threading.Lock()
+        self.searches: list[str] = []
+        self.__server: ThreadingHTTPServer = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self.__handler()
+        )
+        self.url: str = 'http://127.0.0.1:' + str(self.__server.server_address[1])
+        self.__thread: threading.Thread = threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        )
+
+    def __enter__(self) -> 'HDRServer':
+        self.__thread.start()
+        return self
+
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def get(self, path: str, query: dict[str, list[str]]) -> tuple[int, bytes]:
+        if path != '/api/v1/phenotypes/':
+            return 404, b'Not Found'
+        search: str = query.get('search', [''])[0]
+        with self.__lock:
+            self.searches.append(search)
+            if self.failing > 0:
+                self.failing -= 1
+                return 502, b'<html>Bad Gateway</html>'
+        results: list[dict[str, Any]] = [
+            {'phenotype_id': id, 'name': search}
+            for id in self.phenotypes.get(search, [])
+        ]
+        return 200, json.dumps(results).encode()
+
+    def __handler(self) -> type[BaseHTTPRequestHandler]:
+        server: HDRServer = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                url: urllib.parse.SplitResult = urllib.parse.urlsplit(self.path)
+                status, encoded = server.get(url.path, urllib.parse.parse_qs(url.query))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
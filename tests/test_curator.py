@@ -1,4 +1,5 @@
-import json, sys, uuid
+import json, os, pickle, re, subprocess, sys, textwrap, threading, types, uuid
+from pathlib import Path
 
 import pytest  # type: ignore
 from dotenv import load_dotenv
@@ -7,8 +8,10 @@ from curator.curator_types import CuratorRepo
 from curator.curator_github import CuratorGithub
 from curator.workflow import Workflow
 from curator.curator import Curator
+from util.metrics import Metrics
 from util.set_tuple_encoder import SetTupleEncoder
 from tests.curator import TestCurator
+from tests.hdr_server import HDRServer
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -16,6 +19,53 @@ def load_env() -> None:
     load_dotenv()
 
 
+STARTUP: str = textwrap.dedent('''
+    import json, pickle, sys, time
+    start = time.perf_counter()
+    from curator.curator import Curator
+    from curator.workflow import Workflow
+    Curator()
+    with open('workflows.p', 'rb') as file:
+        workflows = pickle.load(file)
+    Workflow().getIntersections(workflows, Workflow().getPhenotypeGroups(workflows))
+    loaded = [
+        module
+        for module in ['spacy', 'fuzzywuzzy', 'pyconceptlibraryclient', 'llm']
+        if module in sys.modules
+    ]
+    print(json.dumps([time.perf_counter() - start, loaded]))
+    ''')
+
+
+def test_startupTime(tmp_path: Path) -> None:
+    # a run that only reads cached stages must not load models or clients
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Asthma---1', 'Asthma - PH1'): [],
+        CuratorRepo('Asthma-Severe---2', 'Asthma Severe - PH2'): [],
+    }
+    os.mkdir(tmp_path / 'output')
+    with open(tmp_path / 'output' / 'phenotypeGroups.p', 'wb') as f:
+        pickle.dump({list(workflows)[0]: [list(workflows)[1]]}, f)
+    with open(tmp_path / 'output' / 'intersections.p', 'wb') as f:
+        pickle.dump({list(workflows)[0]: {}}, f)
+    with open(tmp_path / 'workflows.p', 'wb') as f:
+        pickle.dump(workflows, f)
+    result: subprocess.CompletedProcess[str] = subprocess.run(
+        [sys.executable, '-c', STARTUP],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            'PYTHONPATH': str(Path(__file__).parent.parent / 'src'),
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    assert loaded == []
+    assert elapsed < 1
+
+
 def test_removeDuplicates() -> None:
     assert TestCurator().removeDuplicates(
         [CuratorRepo('Metformin', '')],
@@ -42,6 +92,186 @@ def test_removeDuplicates() -> None:
     }
 
 
+def test_removeDuplicates_memberIndex() -> None:
+    curator: TestCurator = TestCurator()
+    insulin: list[CuratorRepo] = [CuratorRepo('Insulin', '')]
+    phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {
+        CuratorRepo('Type 1 Diabetes', ''): [CuratorRepo('Metformin', '')],
+        CuratorRepo('Type 2 Diabetes', ''): insulin,
+        CuratorRepo('COPD', ''): [CuratorRepo('Metformin', '')],
+        CuratorRepo('Asthma', ''): [],
+    }
+    memberIndex: dict[CuratorRepo, set[CuratorRepo]] = curator.memberIndex(
+        phenotypeGroups
+    )
+    assert memberIndex[CuratorRepo('Metformin', '')] == {
+        CuratorRepo('Type 1 Diabetes', ''),
+        CuratorRepo('COPD', ''),
+    }
+    curator.removeDuplicates([], phenotypeGroups, [], memberIndex)
+    assert CuratorRepo('Asthma', '') in phenotypeGroups
+    assert curator.removeDuplicates(
+        [CuratorRepo('Metformin', '')],
+        phenotypeGroups,
+        [CuratorRepo('Type 1 Diabetes', '')],
+        memberIndex,
+    ) == {
+        CuratorRepo('Type 1 Diabetes', ''): [CuratorRepo('Metformin', '')],
+        CuratorRepo('Type 2 Diabetes', ''): [CuratorRepo('Insulin', '')],
+    }
+    # groups without the duplicate are left as they were
+    assert phenotypeGroups[CuratorRepo('Type 2 Diabetes', '')] is insulin
+    assert memberIndex[CuratorRepo('Metformin', '')] == {
+        CuratorRepo('Type 1 Diabetes', '')
+    }
+
+
+def test_phenotypeIndex() -> None:
+    assert TestCurator().phenotypeIndex(
+        [
+            CuratorRepo('Diabetes---1', 'Diabetes - PH12'),
+            CuratorRepo('Diabetes---2', 'Diabetes - PH1'),
+            CuratorRepo('Diabetes---3', 'Diabetes - PH1'),
+            CuratorRepo('Asthma---4', 'Asthma'),
+        ]
+    ) == {
+        'PH12': CuratorRepo('Diabetes---1', 'Diabetes - PH12'),
+        'PH1': CuratorRepo('Diabetes---2', 'Diabetes - PH1'),
+    }
+
+
+def test_prefetchFromHDR(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    os.mkdir('config')
+    diabetes: CuratorRepo = CuratorRepo('Diabetes---1', 'Diabetes - PH1')
+    mellitus: CuratorRepo = CuratorRepo('Diabetes---2', 'Diabetes Mellitus - PH2')
+    asthma: CuratorRepo = CuratorRepo('Asthma---3', 'Asthma - PH3')
+    copd: CuratorRepo = CuratorRepo('Copd---4', 'COPD - PH4')
+    with HDRServer(
+        {'Diabetes': ['PH1', 'PH2', 'PH9'], 'Asthma': ['PH3', 'PH4']}, failing=2
+    ) as server:
+        with open('config/config.ini', 'w') as f:
+            f.write('[HDR]\nURL=' + server.url + '\nWORKERS=2\nBACKOFF=0.01\n')
+        metrics: Metrics = Metrics()
+        curator: TestCurator = TestCurator(metrics)
+        curator.prefetchFromHDR([diabetes, mellitus, asthma])
+        # each distinct search once, with the failed attempts retried
+        assert sorted(set(server.searches)) == ['Asthma', 'Diabetes']
+        assert len(server.searches) == 4
+        assert metrics.counter('hdr retries') == 2
+        server.searches.clear()
+        curator.prefetchFromHDR([diabetes, asthma])
+        assert server.searches == []
+        assert curator.additionalPhenotypesFromHDR(
+            (asthma, []),
+            curator.phenotypeIndex([diabetes, mellitus, asthma, copd]),
+        ) == [copd]
+        assert metrics.counter('hdr cache hits') == 1
+        assert server.searches == []
+
+
+class ConcurrentLLMClient:
+
+    # answers only once all three classifications are in flight together
+    barrier: threading.Barrier = threading.Barrier(3, timeout=10)
+
+    def __init__(self, debug: bool) -> None:
+        pass
+
+    def sendMessage(self, message: str) -> str:
+        ConcurrentLLMClient.barrier.wait()
+        conditions: list[str] = [
+            line.split(': ')[1].rstrip(',.')
+            for line in message.splitlines()
+            if re.match(r'^[0-9]+: ', line)
+        ]
+        answers: dict[str, list[str]] = {
+            'another way of writing': ['Diabetes Mellitus Type 1'],
+            'medications for': ['Insulin', 'Metformin'],
+            'subconditions': ['Metformin'],
+        }
+        return str(
+            [
+                conditions.index(condition) + 1
+                for prompt, included in answers.items()
+                if prompt in message
+                for condition in included
+            ]
+        )
+
+
+def test_removeUnrelatedPhenotypesUsingLLM_concurrent(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    os.mkdir('config')
+    with open('config/config.ini', 'w') as f:
+        f.write('[CURATOR]\nLLM_WORKERS=3\n')
+    llmClient: types.ModuleType = types.ModuleType('llm.llm_client')
+    setattr(llmClient, 'LLMClient', ConcurrentLLMClient)
+    monkeypatch.setitem(sys.modules, 'llm.llm_client', llmClient)
+    assert sorted(
+        TestCurator().removeUnrelatedPhenotypesUsingLLM(
+            CuratorRepo('Type-1-Diabetes---1', ''),
+            [
+                CuratorRepo('Type-2-Diabetes---2', ''),
+                CuratorRepo('Metformin---3', ''),
+                CuratorRepo('Insulin---4', ''),
+                CuratorRepo('Diabetes-Mellitus-Type-1---5', ''),
+            ],
+        ),
+        key=lambda repo: repo.name,
+    ) == [
+        CuratorRepo('Diabetes-Mellitus-Type-1---5', ''),
+        CuratorRepo('Insulin---4', ''),
+    ]
+
+
+class CountingLLMClient:
+
+    messages: list[str] = []
+    clients: int = 0
+
+    def __init__(self, debug: bool) -> None:
+        CountingLLMClient.clients += 1
+
+    def sendMessage(self, message: str) -> str:
+        CountingLLMClient.messages.append(message)
+        return '[1]' if 'medications for' in message else '[]'
+
+
+def test_removeUnrelatedPhenotypesUsingLLM_cached(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    os.mkdir('config')
+    llmClient: types.ModuleType = types.ModuleType('llm.llm_client')
+    setattr(llmClient, 'LLMClient', CountingLLMClient)
+    monkeypatch.setitem(sys.modules, 'llm.llm_client', llmClient)
+    lead: CuratorRepo = CuratorRepo('Type-1-Diabetes---1', '')
+    phenotypes: list[CuratorRepo] = [CuratorRepo('Insulin---2', '')]
+    for run, model in enumerate(['counting', 'counting', 'recounting', None]):
+        with open('config/config.ini', 'w') as f:
+            f.write('[CURATOR]\nLLM_WORKERS=3\n[LLM]\nTEMPERATURE=0\n')
+            if model is not None:
+                f.write('MODEL=' + model + '\n')
+        metrics: Metrics = Metrics()
+        # every run starts from a new client, as separate processes would
+        assert TestCurator(metrics).removeUnrelatedPhenotypesUsingLLM(
+            lead, phenotypes
+        ) == [CuratorRepo('Insulin---2', '')]
+        # another model is a different cache entry, and no model means no cache
+        assert metrics.counter('llm cache hits') == [0, 3, 0, 0][run]
+        assert metrics.counter('llm cache misses') == [3, 0, 3, 0][run]
+        assert metrics.counter('llm calls') == [3, 0, 3, 3][run]
+    assert len(CountingLLMClient.messages) == 9
+    # a run answered entirely from the cache never builds a client
+    assert CountingLLMClient.clients == 3
+
+
 def test_removeUnrelatedPhenotypesUsingLLM() -> None:
     assert TestCurator().removeUnrelatedPhenotypesUsingLLM(
         CuratorRepo('Type 1 Diabetes', ''),
@@ -1,4 +1,6 @@
-import json
+import json, os
+from typing import Generator
+from pathlib import Path
 import pytest  # type: ignore
 from dotenv import load_dotenv
 
@@ -6,7 +8,11 @@ from github.Repository import Repository
 
 from util.set_tuple_encoder import SetTupleEncoder
 from curator.curator_github import CuratorGithub
-from curator.curator_types import CuratorRepo
+from curator.curator_store import CuratorStore
+from curator.curator_types import CuratorRepo, SyncResult
+from tests.github_server import GithubServer
+from util.metrics import Metrics
+from util.rate_limiter import RateLimiter
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -28,3 +34,277 @@ def test_getRepoToSteps() -> None:
     assert len(repoToSteps)
     with open('repoToSteps.json', 'w') as file:
         file.write(json.dumps(repoToSteps, cls=SetTupleEncoder, indent=2))
+
+
+def test_getRepoToSteps_concurrent(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': (
+            'Diabetes - PH1',
+            [
+                'a---primary.cwl',
+                'dir1/b---icd.cwl',
+                'dir1/sub/d---primary.cwl',
+                'dir2/c---primary.cwl',
+                'e---output.cwl',
+                'README.md',
+            ],
+        ),
+        'phenoflow.github.io': ('', ['index.html']),
+        'Asthma---2': ('Asthma - PH2', ['dir/f---primary.cwl', 'g---load.cwl']),
+        'Copd---3': ('', []),
+    }
+    expected: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            'a---primary.cwl',
+            'e---output.cwl',
+            'b---icd.cwl',
+            'c---primary.cwl',
+            'd---primary.cwl',
+        ],
+        CuratorRepo('Asthma---2', 'Asthma - PH2'): [
+            'g---load.cwl',
+            'f---primary.cwl',
+        ],
+        CuratorRepo('Copd---3', ''): [],
+    }
+    with GithubServer(repos) as server:
+        for workers in [1, 4]:
+            os.makedirs(tmp_path / str(workers) / 'output')
+            monkeypatch.chdir(tmp_path / str(workers))
+            repoToSteps: dict[CuratorRepo, list[str]] = CuratorGithub(
+                workers=workers, baseUrl=server.url, recursive=False
+            ).getRepoToSteps()
+            assert repoToSteps == expected
+            assert list(repoToSteps) == list(expected)
+
+
+def test_getRepoToSteps_recursive(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': (
+            'Diabetes - PH1',
+            [
+                'a---primary.cwl',
+                'dir1/b---icd.cwl',
+                'dir1/sub/d---primary.cwl',
+                'dir2/c---primary.cwl',
+                'e---output.cwl',
+            ],
+        ),
+        'Asthma---2': ('Asthma - PH2', ['dir/f---primary.cwl', 'g---load.cwl']),
+    }
+    with GithubServer(repos, truncated={'Asthma---2'}) as server:
+        assert CuratorGithub(baseUrl=server.url).getRepoToSteps() == {
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+                'a---primary.cwl',
+                'e---output.cwl',
+                'b---icd.cwl',
+                'c---primary.cwl',
+                'd---primary.cwl',
+            ],
+            CuratorRepo('Asthma---2', 'Asthma - PH2'): [
+                'g---load.cwl',
+                'f---primary.cwl',
+            ],
+        }
+        # one tree request lists a whole repo, the truncated one is walked instead
+        assert [
+            request for request in server.requests if '/Diabetes---1/' in request
+        ] == ['/repos/phenoflow/Diabetes---1/git/trees/main']
+        assert '/repos/phenoflow/Asthma---2/contents/dir' in server.requests
+
+
+def test_getRepoToSteps_order(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': ('Diabetes - PH1', ['a---primary.cwl']),
+        'Asthma---2': ('Asthma - PH2', ['b---primary.cwl']),
+        'Copd---3': ('COPD - PH3', ['c---primary.cwl']),
+    }
+    with GithubServer(repos, slow={'Diabetes---1': 0.5}) as server:
+        # the first repo finishes last, but is still stored first
+        for _ in range(2):
+            assert list(
+                CuratorGithub(workers=4, baseUrl=server.url).getRepoToSteps()
+            ) == [
+                CuratorRepo('Diabetes---1', 'Diabetes - PH1'),
+                CuratorRepo('Asthma---2', 'Asthma - PH2'),
+                CuratorRepo('Copd---3', 'COPD - PH3'),
+            ]
+
+
+def test_getRepoToSteps_rateLimited(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': ('Diabetes - PH1', ['a---primary.cwl']),
+        'Asthma---2': ('Asthma - PH2', ['dir/f---primary.cwl']),
+    }
+    metrics: Metrics = Metrics()
+    with GithubServer(repos, limited=2) as server:
+        assert CuratorGithub(metrics=metrics, baseUrl=server.url).getRepoToSteps() == {
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'): ['a---primary.cwl'],
+            CuratorRepo('Asthma---2', 'Asthma - PH2'): ['f---primary.cwl'],
+        }
+        # quota comes from response headers, never from extra rate limit requests
+        assert '/rate_limit' not in server.requests
+    assert metrics.counter('rate limit pauses') == 2
+
+
+def test_getRepoToSteps_budget(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Phenotype---' + str(id): ('Phenotype - PH' + str(id), ['a---primary.cwl'])
+        for id in range(80)
+    }
+    metrics: Metrics = Metrics()
+    with GithubServer(repos) as server:
+        assert (
+            len(CuratorGithub(metrics=metrics, baseUrl=server.url).getRepoToSteps())
+            == 80
+        )
+    # a burst within the bucket and the reported quota is never held back
+    assert metrics.counter('rate limit waits') == 0
+
+
+def test_getRepoToSteps_paced(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Phenotype---' + str(id): ('Phenotype - PH' + str(id), ['a---primary.cwl'])
+        for id in range(30)
+    }
+    metrics: Metrics = Metrics()
+    with GithubServer(repos) as server:
+        assert (
+            len(
+                CuratorGithub(
+                    metrics=metrics,
+                    baseUrl=server.url,
+                    rateLimiter=RateLimiter(rate=50, burst=10),
+                ).getRepoToSteps()
+            )
+            == 30
+        )
+    # a burst beyond the bucket is smoothed out rather than refused
+    assert metrics.counter('rate limit waits') > 0
+    assert metrics.counter('rate limit pauses') == 0
+
+
+def test_iterRepoSteps(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': ('Diabetes - PH1', ['a---primary.cwl']),
+        'Asthma---2': ('Asthma - PH2', ['dir/b---primary.cwl']),
+        'Copd---3': ('COPD - PH3', ['c---primary.cwl']),
+    }
+    with GithubServer(repos) as server:
+        repoSteps: Generator[tuple[CuratorRepo, list[str]], None, None] = CuratorGithub(
+            flushInterval=1, baseUrl=server.url
+        ).iterRepoSteps()
+        first: tuple[CuratorRepo, list[str]] = next(repoSteps)
+        repoSteps.close()
+        # whatever was yielded before stopping is kept
+        server.requests.clear()
+        streamed: list[tuple[CuratorRepo, list[str]]] = list(
+            CuratorGithub(baseUrl=server.url).iterRepoSteps()
+        )
+        assert streamed[0] == first
+        assert dict(streamed) == {
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'): ['a---primary.cwl'],
+            CuratorRepo('Asthma---2', 'Asthma - PH2'): ['b---primary.cwl'],
+            CuratorRepo('Copd---3', 'COPD - PH3'): ['c---primary.cwl'],
+        }
+        assert (
+            '/repos/phenoflow/' + first[0].name + '/git/trees/main'
+            not in server.requests
+        )
+        assert len(list(CuratorGithub(baseUrl=server.url).iterRepoSteps())) == 3
+    # the steps are written through to the store in the order they were streamed
+    with CuratorStore() as store:
+        assert list(store.getRepoToSteps().items()) == streamed
+        assert store.getReposWithStep('b---primary.cwl') == [
+            CuratorRepo('Asthma---2', 'Asthma - PH2')
+        ]
+
+
+def test_sync(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': ('Diabetes - PH1', ['a---primary.cwl']),
+        'Asthma---2': ('Asthma - PH2', ['b---primary.cwl']),
+        'Copd---3': ('COPD - PH3', ['c---primary.cwl']),
+    }
+    with GithubServer(repos) as server:
+        result: SyncResult = CuratorGithub(baseUrl=server.url).sync()
+        assert result.changed == [
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'),
+            CuratorRepo('Asthma---2', 'Asthma - PH2'),
+            CuratorRepo('Copd---3', 'COPD - PH3'),
+        ]
+        assert result.removed == []
+        # nothing changed, so the listing is not modified and no repo is fetched again
+        server.requests.clear()
+        server.statuses.clear()
+        result = CuratorGithub(baseUrl=server.url).sync()
+        assert result.changed == [] and result.removed == []
+        assert server.statuses == [304]
+        assert len(result.repoToSteps) == 3
+        # a push, an edited description, a deleted repo and a new one
+        server.repos['Diabetes---1'] = (
+            'Diabetes - PH1',
+            ['a---primary.cwl', 'd---primary.cwl'],
+        )
+        server.repos['Asthma---2'] = ('Asthma (Severe) - PH2', ['b---primary.cwl'])
+        del server.repos['Copd---3']
+        server.repos['Dementia---4'] = ('Dementia - PH4', ['e---primary.cwl'])
+        server.requests.clear()
+        result = CuratorGithub(baseUrl=server.url).sync()
+        assert result.changed == [
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'),
+            CuratorRepo('Asthma---2', 'Asthma (Severe) - PH2'),
+            CuratorRepo('Dementia---4', 'Dementia - PH4'),
+        ]
+        assert result.removed == [CuratorRepo('Copd---3', 'COPD - PH3')]
+        assert result.repoToSteps == {
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+                'a---primary.cwl',
+                'd---primary.cwl',
+            ],
+            CuratorRepo('Asthma---2', 'Asthma (Severe) - PH2'): ['b---primary.cwl'],
+            CuratorRepo('Dementia---4', 'Dementia - PH4'): ['e---primary.cwl'],
+        }
+        assert sorted(
+            request for request in server.requests if '/git/trees/' in request
+        ) == [
+            '/repos/phenoflow/Dementia---4/git/trees/main',
+            '/repos/phenoflow/Diabetes---1/git/trees/main',
+        ]
+    assert CuratorGithub(baseUrl=server.url).getRepoToSteps() == result.repoToSteps
+    # pushes, edits and deletions reach the store as well as the journal
+    with CuratorStore() as store:
+        assert store.getRepoToSteps() == result.repoToSteps
+        assert store.getReposWithStep('b---primary.cwl') == [
+            CuratorRepo('Asthma---2', 'Asthma (Severe) - PH2')
+        ]
+        assert store.getSteps(CuratorRepo('Copd---3', 'COPD - PH3')) is None
@@ -0,0 +1,68 @@
+import os, subprocess
+from pathlib import Path
+import pytest  # type: ignore
+
+from curator.curator_github import CuratorGithub
+from curator.curator_mirror import CuratorMirror
+from curator.curator_types import CuratorRepo
+from tests.github_server import GithubServer
+from util.metrics import Metrics
+
+
+def git(*args: str) -> None:
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@test', *args],
+        capture_output=True,
+        check=True,
+    )
+
+
+def test_getRepoToSteps(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    monkeypatch.setenv('GITHUB_ACCESS_TOKEN', 'token')
+    repos: dict[str, tuple[str, list[str]]] = {
+        'Diabetes---1': (
+            'Diabetes - PH1',
+            [
+                'a---primary.cwl',
+                'dir1/b---icd.cwl',
+                'dir1/sub/d---primary.cwl',
+                'dir2/c---primary.cwl',
+                'e---output.cwl',
+                'README.md',
+            ],
+        ),
+        'phenoflow.github.io': ('', ['index.html']),
+        'Asthma---2': ('Asthma - PH2', ['dir/f---primary.cwl', 'g---load.cwl']),
+        'Copd---3': ('', []),
+    }
+    for position, (name, (description, paths)) in enumerate(repos.items()):
+        source: Path = tmp_path / 'source' / name
+        for path in paths:
+            os.makedirs((source / path).parent, exist_ok=True)
+            (source / path).write_text(path)
+        git('init', '-q', str(source))
+        git('-C', str(source), 'add', '-A')
+        git('-C', str(source), 'commit', '-q', '--allow-empty', '-m', name)
+        # a mix of bare, shallow and working clones
+        clone: Path = tmp_path / 'mirror' / [name + '.git', name, name][position % 3]
+        if position % 3 == 0:
+            git('clone', '-q', '--bare', str(source), str(clone))
+        else:
+            git('clone', '-q', '--depth', '1', 'file://' + str(source), str(clone))
+    # descriptions come from the repos listed by the crawl, left in output/repos.p
+    with GithubServer(repos) as server:
+        expected: dict[CuratorRepo, list[str]] = CuratorGithub(
+            baseUrl=server.url
+        ).getRepoToSteps()
+    assert len(expected) == 3
+    for processes in [1, 2]:
+        metrics: Metrics = Metrics()
+        repoToSteps: dict[CuratorRepo, list[str]] = CuratorMirror(
+            str(tmp_path / 'mirror'), processes, metrics
+        ).getRepoToSteps()
+        assert repoToSteps == expected
+        # in the order the repos were listed, not the order of the clones on disk
+        assert list(repoToSteps) == list(expected)
+        assert metrics.counter('clones read') == 3
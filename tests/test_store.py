@@ -0,0 +1,85 @@
+import os, pickle
+from pathlib import Path
+import pytest  # type: ignore
+
+from curator.curator_store import CuratorStore
+from curator.curator_types import CuratorRepo
+from util.journal import Journal
+
+
+def test_importPickles(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    diabetes: CuratorRepo = CuratorRepo('Diabetes---1', 'Diabetes - PH1')
+    mellitus: CuratorRepo = CuratorRepo(
+        'Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'
+    )
+    asthma: CuratorRepo = CuratorRepo('Asthma---3', 'Asthma - PH3')
+    repoToSteps: dict[CuratorRepo, list[str]] = {
+        diabetes: ['diabetes---primary.cwl', 'output---output.cwl'],
+        mellitus: ['diabetes-mellitus---primary.cwl'],
+        asthma: [],
+    }
+    phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {diabetes: [mellitus]}
+    intersections: dict[
+        CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
+    ] = {
+        diabetes: {
+            (diabetes, mellitus): {
+                ('diabetes---primary.cwl', 'diabetes-mellitus---primary.cwl')
+            }
+        }
+    }
+    hdr: dict[str, list[dict[str, str]]] = {'Diabetes': [{'phenotype_id': 'PH2'}]}
+    journal: Journal[CuratorRepo, list[str]] = Journal('output/repoToSteps.p')
+    with journal:
+        for repo, steps in repoToSteps.items():
+            journal.put(repo, steps)
+    for name, value in [
+        ('phenotypeGroups.p', phenotypeGroups),
+        ('intersections.p', intersections),
+        ('additionalPhenotypesFromHDR.p', hdr),
+    ]:
+        with open(os.path.join('output', name), 'wb') as f:
+            pickle.dump(value, f)
+    # a new store picks up the pickles left by earlier runs
+    with CuratorStore() as store:
+        assert store.getRepoToSteps() == repoToSteps
+        assert list(store.getRepoToSteps()) == list(repoToSteps)
+        assert store.getSteps(asthma) == []
+        assert store.getSteps(CuratorRepo('Copd---4', 'COPD - PH4')) is None
+        assert store.getReposWithStep('diabetes---primary.cwl') == [diabetes]
+        assert store.getPhenotypeGroups(False) == phenotypeGroups
+        assert store.getPhenotypeGroups(True) is None
+        assert store.getGroupsWithMember(mellitus, False) == [diabetes]
+        assert store.getHdrResults('Diabetes') == hdr['Diabetes']
+        assert store.getHdrResults('Asthma') is None
+        assert store.getIntersected() == [diabetes]
+        assert store.getIntersection(diabetes) == intersections[diabetes]
+        assert store.getIntersection(asthma) is None
+        store.removeRepoSteps(asthma)
+        store.putIntersection(asthma, {})
+    os.mkdir('export')
+    with CuratorStore() as store:
+        store.exportPickles('export')
+    with open('export/intersections.p', 'rb') as file:
+        assert pickle.load(file) == {**intersections, asthma: {}}
+    with open('export/phenotypeGroups.p', 'rb') as file:
+        assert pickle.load(file) == phenotypeGroups
+    assert not os.path.exists('export/similarPhenotypeGroups.p')
+    assert Journal('export/repoToSteps.p').load() == {
+        diabetes: repoToSteps[diabetes],
+        mellitus: repoToSteps[mellitus],
+    }
+
+
+def test_llmResponses(tmp_path: Path) -> None:
+    with CuratorStore(str(tmp_path / 'curator.db')) as store:
+        store.putLLMResponse('a', '[1]', 2)
+        store.putLLMResponse('b', '[2]', 2)
+        assert store.getLLMResponse('a') == '[1]'
+        # b is now the least recently used, so it makes way for c
+        store.putLLMResponse('c', '[]', 2)
+        assert store.getLLMResponse('b') is None
+        assert store.getLLMResponse('a') == '[1]'
+        assert store.getLLMResponse('c') == '[]'
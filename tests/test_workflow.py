@@ -1,4 +1,6 @@
-import sys
+import json, os, sys
+from pathlib import Path
+from typing import Any
 import pytest  # type: ignore
 from dotenv import load_dotenv
 
@@ -6,6 +8,7 @@ from curator.workflow import Workflow
 from tests.workflow import TestWorkflow
 from curator.curator_github import CuratorGithub
 from curator.curator_types import CuratorRepo
+from util.metrics import Metrics
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -113,6 +116,69 @@ def test_isNegative() -> None:
     )
 
 
+def test_getPhenotypeGroups_prefixMatches(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    assert Workflow().getPhenotypeGroups(
+        {
+            CuratorRepo('Diabetes-Mellitus---1', 'Diabetes Mellitus - PH1'): [],
+            CuratorRepo('Asthma---2', 'Asthma - PH2'): [],
+            CuratorRepo('Diabetes---3', 'Diabetes - PH3'): [],
+            CuratorRepo('Diabetes-Insipidus---4', 'Diabetes Insipidus - PH4'): [],
+            CuratorRepo('Asthma-Severe---5', 'Asthma Severe - PH5'): [],
+            CuratorRepo('Diabetes---6', 'Diabetes - PH6'): [],
+        }
+    ) == {
+        CuratorRepo('Diabetes-Mellitus---1', 'Diabetes Mellitus - PH1'): [
+            CuratorRepo('Diabetes---3', 'Diabetes - PH3'),
+            CuratorRepo('Diabetes---6', 'Diabetes - PH6'),
+        ],
+        CuratorRepo('Asthma---2', 'Asthma - PH2'): [
+            CuratorRepo('Asthma-Severe---5', 'Asthma Severe - PH5'),
+        ],
+    }
+
+
+def test_getPhenotypeGroups_similarity(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes-Mellitus---1', 'Diabetes Mellitus - PH1'): [],
+        CuratorRepo('Diabetes-Melitus---2', 'Diabetes Melitus - PH2'): [],
+        CuratorRepo('Asthma---3', 'Asthma - PH3'): [],
+    }
+    assert Workflow().getPhenotypeGroups(workflows) == {}
+    assert Workflow().getPhenotypeGroups(workflows, similarity=True) == {
+        CuratorRepo('Diabetes-Mellitus---1', 'Diabetes Mellitus - PH1'): [
+            CuratorRepo('Diabetes-Melitus---2', 'Diabetes Melitus - PH2'),
+        ],
+    }
+
+
+def test_addToPhenotypeGroups(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [],
+        CuratorRepo('Asthma---2', 'Asthma - PH2'): [],
+        CuratorRepo('Diabetes-Mellitus---3', 'Diabetes Mellitus - PH3'): [],
+        CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'): [],
+    }
+    Workflow().getPhenotypeGroups(dict(list(workflows.items())[:2]))
+    assert Workflow().addToPhenotypeGroups(workflows) == {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            CuratorRepo('Diabetes-Mellitus---3', 'Diabetes Mellitus - PH3'),
+        ],
+        CuratorRepo('Asthma---2', 'Asthma - PH2'): [
+            CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'),
+        ],
+    }
+
+
 def test_getPhenotypeGroups() -> None:
     phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = getPhenotypeGroups()
     assert len(phenotypeGroups)
@@ -127,3 +193,116 @@ def test_workflowIntersection() -> None:
         getPhenotypeGroups(),
     )
     assert len(intersections)
+
+
+def test_getIntersections_jobs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            'diabetes-admission---primary.cwl',
+            'diabetes-retinopathy---icd.cwl',
+            'diabetes-output---output.cwl',
+        ],
+        CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'): [
+            'diabetes-mellitus-admission---primary.cwl',
+            'diabetes-mellitus-retinopathy---icd.cwl',
+        ],
+        CuratorRepo('Asthma---3', 'Asthma - PH3'): [
+            'asthma-inhaler---primary.cwl',
+        ],
+        CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'): [
+            'asthma-severe-inhaler---primary.cwl',
+        ],
+    }
+    phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'),
+        ],
+        CuratorRepo('Asthma---3', 'Asthma - PH3'): [
+            CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'),
+        ],
+    }
+    os.mkdir(tmp_path / 'serial')
+    monkeypatch.chdir(tmp_path / 'serial')
+    os.mkdir('output')
+    serial: dict[
+        CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
+    ] = Workflow().getIntersections(workflows, phenotypeGroups)
+    os.mkdir(tmp_path / 'parallel')
+    monkeypatch.chdir(tmp_path / 'parallel')
+    os.mkdir('output')
+    parallel: dict[
+        CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
+    ] = Workflow().getIntersections(workflows, phenotypeGroups, jobs=2)
+    assert list(parallel) == list(phenotypeGroups)
+    assert parallel == serial
+    assert (
+        'diabetes-admission---primary.cwl',
+        'diabetes-mellitus-admission---primary.cwl',
+    ) in serial[CuratorRepo('Diabetes---1', 'Diabetes - PH1')][
+        (
+            CuratorRepo('Diabetes---1', 'Diabetes - PH1'),
+            CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'),
+        )
+    ]
+
+
+def test_getPhenotypeGroups_metrics(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    metrics: Metrics = Metrics()
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [],
+        CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'): [],
+    }
+    Workflow(metrics=metrics).getPhenotypeGroups(workflows)
+    Workflow(metrics=metrics).getPhenotypeGroups(workflows)
+    metrics.export('output/metrics.json')
+    with open('output/metrics.json') as file:
+        exported: dict[str, Any] = json.load(file)
+    assert exported['counters']['workflows grouped'] == 2
+    assert exported['counters']['phenotype group cache hits'] == 1
+    assert exported['timers']['grouping']['calls'] == 1
+
+
+def test_getIntersections_resume(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('output')
+    workflows: dict[CuratorRepo, list[str]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            'diabetes-admission---primary.cwl',
+        ],
+        CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'): [
+            'diabetes-mellitus-admission---primary.cwl',
+        ],
+        CuratorRepo('Asthma---3', 'Asthma - PH3'): [
+            'asthma-inhaler---primary.cwl',
+        ],
+        CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'): [
+            'asthma-severe-inhaler---primary.cwl',
+        ],
+    }
+    phenotypeGroups: dict[CuratorRepo, list[CuratorRepo]] = {
+        CuratorRepo('Diabetes---1', 'Diabetes - PH1'): [
+            CuratorRepo('Diabetes-Mellitus---2', 'Diabetes Mellitus - PH2'),
+        ],
+        CuratorRepo('Asthma---3', 'Asthma - PH3'): [
+            CuratorRepo('Asthma-Severe---4', 'Asthma Severe - PH4'),
+        ],
+    }
+    Workflow().getIntersections(workflows, dict(list(phenotypeGroups.items())[:1]))
+    metrics: Metrics = Metrics()
+    intersections: dict[
+        CuratorRepo, dict[tuple[CuratorRepo, CuratorRepo], set[tuple[str, str]]]
+    ] = Workflow(metrics=metrics).getIntersections(workflows, phenotypeGroups)
+    assert metrics.counter('groups resumed') == 1
+    assert metrics.counter('groups intersected') == 1
+    assert list(intersections) == list(phenotypeGroups)
+    assert (
+        Workflow().getIntersection(CuratorRepo('Asthma---3', 'Asthma - PH3'))
+        == intersections[CuratorRepo('Asthma---3', 'Asthma - PH3')]
+    )
+    assert Workflow().getIntersection(CuratorRepo('Copd---5', 'COPD - PH5')) is None